@@ -0,0 +1,55 @@
+from typing import Annotated, List
+
+from fastapi import APIRouter, Depends, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.admin import schemas
+from app.auth.router_class import RouteAdmin
+from app.database import get_session
+from app.pagination import encode_cursor
+
+router_admin = APIRouter(
+    prefix="/admin",
+    tags=["admin"],
+    route_class=RouteAdmin,
+)
+
+
+@router_admin.get(
+    "/activity",
+    response_model=schemas.ActivityPage,
+    status_code=status.HTTP_200_OK,
+)
+async def get_activity(
+        session: Annotated[AsyncSession, Depends(get_session)],
+        q: Annotated[schemas.FilterActivity, Depends()],
+):
+    """
+    Request logs from new to old, for superusers only.\n
+    Filter: user, auth, url, status, date_from, date_to \n
+    Pages: pass next_cursor of the page as cursor to get the next one,
+    next_cursor is null on the last page.
+    """
+    items = list(await session.scalars(q.select_activity()))
+    next_cursor = None
+    if len(items) == q.limit:
+        next_cursor = encode_cursor(items[-1].created, items[-1].id)
+    return {"items": items, "next_cursor": next_cursor}
+
+
+@router_admin.get(
+    "/route-stats",
+    response_model=List[schemas.RouteStatsPoint],
+    status_code=status.HTTP_200_OK,
+)
+async def get_route_stats(
+        session: Annotated[AsyncSession, Depends(get_session)],
+        q: Annotated[schemas.FilterRouteStats, Depends()],
+):
+    """
+    Time series of requests by route and method, from the per-minute
+    rollups: count, errors, latency and its p50, p95, p99. \n
+    step merges the minutes, by_status splits the series by status.
+    """
+    rows = await session.scalars(q.select_stats())
+    return q.series(list(rows))
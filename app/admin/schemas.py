@@ -0,0 +1,174 @@
+import datetime
+from typing import List, Optional
+
+from pydantic import BaseModel, ConfigDict, Field
+from sqlalchemy import select, Select, tuple_
+
+from app.auth.models import UsersActivity, RouteStats
+from app.auth.stats import merge_sketches, sketch_quantile
+from app.pagination import decode_cursor
+
+
+class Activity(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: int
+    created: datetime.datetime
+    url: str
+    method: str
+    addr: Optional[str]
+    port: Optional[int]
+    user_agent: Optional[str]
+    content_type: Optional[str]
+    content_length: Optional[str]
+    query_string: Optional[str]
+    body: Optional[str]
+    form_data: Optional[str]
+    body_truncated: bool
+    user: Optional[int]
+    auth: Optional[int]
+    result_status: Optional[int]
+    result_len: Optional[int]
+    result_content: Optional[str]
+    millis: Optional[float]
+    auth_millis: Optional[float]
+    db_millis: Optional[float]
+    handler_millis: Optional[float]
+    serialize_millis: Optional[float]
+    log_millis: Optional[float]
+    traceback: Optional[str]
+
+
+class FilterActivity(BaseModel):
+    user: Optional[int] = Field(default=None, description="User ID")
+    auth: Optional[int] = Field(default=None, description="Auth ID")
+    url: Optional[str] = None
+    status: Optional[int] = Field(default=None, description="result_status")
+    date_from: Optional[datetime.datetime] = None
+    date_to: Optional[datetime.datetime] = None
+    limit: int = Field(default=50, ge=1, le=500)
+    cursor: Optional[str] = Field(
+        default=None, description="next_cursor of the previous page"
+    )
+
+    def select_activity(self) -> Select:
+        """
+        From new to old by (created, id), every filter
+        has a matching index, see UsersActivity.
+        """
+        u_act = UsersActivity
+        queries = []
+        if self.user is not None:
+            queries.append(u_act.user == self.user)
+        if self.auth is not None:
+            queries.append(u_act.auth == self.auth)
+        if self.url is not None:
+            queries.append(u_act.url == self.url)
+        if self.status is not None:
+            queries.append(u_act.result_status == self.status)
+        if self.date_from:
+            queries.append(u_act.created >= self.date_from)
+        if self.date_to:
+            queries.append(u_act.created <= self.date_to)
+        if self.cursor:
+            created, id_ = decode_cursor(self.cursor, datetime.datetime, int)
+            queries.append(tuple_(u_act.created, u_act.id) < (created, id_))
+
+        return select(u_act).where(*queries).order_by(
+            u_act.created.desc(), u_act.id.desc()
+        ).limit(self.limit)
+
+
+class ActivityPage(BaseModel):
+    items: List[Activity]
+    next_cursor: Optional[str] = Field(
+        default=None, description="Null on the last page"
+    )
+
+
+class FilterRouteStats(BaseModel):
+    route: Optional[str] = Field(
+        default=None, description="Path template, e.g. /posts/{post_id}"
+    )
+    method: Optional[str] = None
+    date_from: datetime.datetime
+    date_to: Optional[datetime.datetime] = None
+    step: int = Field(default=1, ge=1, le=1440, description="Minutes")
+    by_status: bool = False
+
+    def select_stats(self) -> Select:
+        r_stats = RouteStats
+        queries = [r_stats.minute >= self.date_from]
+        if self.date_to:
+            queries.append(r_stats.minute <= self.date_to)
+        if self.route is not None:
+            queries.append(r_stats.route == self.route)
+        if self.method is not None:
+            queries.append(r_stats.method == self.method.upper())
+        return select(r_stats).where(*queries).order_by(r_stats.minute)
+
+    def bucket(self, minute: datetime.datetime) -> datetime.datetime:
+        offset = int((minute - self.date_from).total_seconds() // 60)
+        return self.date_from + datetime.timedelta(
+            minutes=offset - offset % self.step
+        )
+
+    def series(self, rows: List[RouteStats]) -> list[dict]:
+        """Rollups merged by `step` minutes, route, method and status."""
+        points: dict[tuple, dict] = {}
+        for row in rows:
+            key = (
+                self.bucket(row.minute), row.route, row.method,
+                row.status if self.by_status else None,
+            )
+            point = points.get(key)
+            if point is None:
+                points[key] = {
+                    "count": row.count,
+                    "errors": row.count if row.status >= 500 else 0,
+                    "total_millis": row.total_millis,
+                    "min_millis": row.min_millis,
+                    "max_millis": row.max_millis,
+                    "sketch": list(row.sketch),
+                }
+                continue
+            point["count"] += row.count
+            point["errors"] += row.count if row.status >= 500 else 0
+            point["total_millis"] += row.total_millis
+            point["min_millis"] = min(point["min_millis"], row.min_millis)
+            point["max_millis"] = max(point["max_millis"], row.max_millis)
+            point["sketch"] = merge_sketches(point["sketch"], row.sketch)
+
+        result = []
+        for (time, route, method, status), point in points.items():
+            sketch = point.pop("sketch")
+            quantiles = {
+                name: min(
+                    max(sketch_quantile(sketch, q), point["min_millis"]),
+                    point["max_millis"],
+                )
+                for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))
+            }
+            result.append({
+                "time": time, "route": route, "method": method,
+                "status": status, **point, **quantiles,
+                "avg_millis": point["total_millis"] / point["count"],
+            })
+        return result
+
+
+class RouteStatsPoint(BaseModel):
+    time: datetime.datetime
+    route: str
+    method: str
+    status: Optional[int] = Field(
+        default=None, description="Only with by_status"
+    )
+    count: int
+    errors: int = Field(description="Responses with status >= 500")
+    avg_millis: float
+    min_millis: float
+    max_millis: float
+    p50: float
+    p95: float
+    p99: float
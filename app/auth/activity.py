@@ -0,0 +1,229 @@
+import datetime
+import random
+from urllib.parse import unquote
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app import timing
+from app.auth.log_writer import activity_log_writer, ActivityLogWriter
+from app.auth.router_class import BaseUserLogs
+from app.auth.stats import route_stats
+from app.metrics.registry import observe_request
+from app.settings import ACTIVITY_LOG_BODY_LIMIT, SERVER_TIMING
+
+
+class BodyCapture:
+    """
+    Wraps the receive channel of the request and keeps a copy of at most
+    `limit` bytes of the body, while the handler reads the whole body
+    through it as usual.
+    """
+
+    def __init__(self, receive: Receive, limit: int):
+        self.receive = receive
+        self.limit = limit
+        self.head = bytearray()
+        self.truncated = False
+        self.complete = False
+
+    async def __call__(self) -> Message:
+        message = await self.receive()
+        if message["type"] == "http.request":
+            chunk = message.get("body", b"")
+            room = self.limit - len(self.head)
+            if len(chunk) > room:
+                self.truncated = True
+            if room > 0:
+                self.head += chunk[:room]
+            if not message.get("more_body", False):
+                self.complete = True
+        elif message["type"] == "http.disconnect":
+            self.complete = True
+        return message
+
+    async def read(self) -> bytes:
+        """
+        The body the handler did not read is read here,
+        but only up to the limit.
+        """
+        while not self.complete and not self.truncated:
+            await self()
+        return bytes(self.head)
+
+
+class ActivityLogMiddleware:
+    """
+    Writes users_activity records of the requests handled
+    by BaseUserLogs routes, with the logging policy of the route.
+    Status, length and content type of the response are taken from
+    the messages sent, so streaming responses are logged as well.
+    The route adds its part to scope["activity"]: traceback of
+    the error and detail of HTTPException.
+    """
+
+    def __init__(
+            self,
+            app: ASGIApp,
+            log_writer: ActivityLogWriter = activity_log_writer,
+            body_limit: int = ACTIVITY_LOG_BODY_LIMIT,
+    ):
+        self.app = app
+        self.log_writer = log_writer
+        self.body_limit = body_limit
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        with timing.collect() as timings:
+            with timing.measure("log"):
+                u_act = self.create_log(scope)
+                capture = BodyCapture(receive, self.body_limit)
+            scope["activity"] = u_act
+
+            async def send_wrapper(message: Message):
+                if message["type"] == "http.response.start":
+                    # once the response starts, the server no longer
+                    # delivers the body the handler did not read
+                    if self.wants_body(u_act, scope):
+                        with timing.measure("log"):
+                            await capture.read()
+                    u_act["result_status"] = message["status"]
+                    headers = MutableHeaders(scope=message)
+                    if u_act["result_content"] is None:
+                        u_act["result_content"] = headers.get("content-type")
+                    if SERVER_TIMING:
+                        headers.append("Server-Timing", timings.header())
+                elif message["type"] == "http.response.body":
+                    u_act["result_len"] += len(message.get("body", b""))
+                await send(message)
+
+            try:
+                await self.app(scope, capture, send_wrapper)
+            except Exception:
+                if u_act["result_status"] is None:
+                    u_act["result_status"] = 500
+                raise
+            finally:
+                route = scope.get("route")
+                if isinstance(route, BaseUserLogs):
+                    await self.finish_log(u_act, scope, route, capture)
+
+    def create_log(self, scope: Scope) -> dict:
+        headers = Headers(scope=scope)
+        client = scope.get("client") or (None, None)
+        u_act = self.log_writer.new_record(
+            created=datetime.datetime.now(),
+            url=scope["path"],
+            method=scope["method"],
+            addr=client[0],
+            port=client[1],
+            user_agent=headers.get('user-agent'),
+            content_type=headers.get('content-type'),
+            content_length=headers.get('content-length'),
+            body_truncated=False,
+            result_len=0,
+        )
+        if scope.get("query_string"):
+            u_act["query_string"] = scope["query_string"].decode('latin-1')
+        return u_act
+
+    @staticmethod
+    def wants_body(u_act: dict, scope: Scope) -> bool:
+        """Whether capture_body will save the request body."""
+        route = scope.get("route")
+        if not isinstance(route, BaseUserLogs) or not route.log_body or \
+                u_act["url"] in route.exclude_url_path:
+            return False
+        content_type = (u_act["content_type"] or "").split(';')[0]
+        return content_type not in (
+            "", "multipart/form-data", "application/octet-stream"
+        )
+
+    async def capture_body(self, u_act: dict, capture: BodyCapture):
+        """
+        Runs after the handler, the body is read before the response
+        starts. Only the first body_limit bytes of the body are kept.
+        """
+        if u_act["form_data"] is not None:
+            if len(u_act["form_data"]) > self.body_limit:
+                u_act["body_truncated"] = True
+                u_act["form_data"] = u_act["form_data"][:self.body_limit]
+        if not u_act["content_type"]:
+            return
+        match u_act["content_type"].split(';'):
+            case ['multipart/form-data', *_]:
+                pass
+            case ['application/octet-stream', *_]:
+                pass
+            case ['application/x-www-form-urlencoded', *_]:
+                body = await capture.read()
+                u_act["body"] = unquote(body.decode(errors='replace'))
+                u_act["body_truncated"] = capture.truncated
+            case _:
+                body = await capture.read()
+                u_act["body"] = body.decode(errors='replace')
+                u_act["body_truncated"] = capture.truncated
+
+    @staticmethod
+    def should_log(u_act: dict, route: BaseUserLogs) -> bool:
+        # no result_status - the request or the response is invalid
+        if u_act["result_status"] is None or \
+                u_act["result_status"] >= route.log_error_status:
+            return True
+        if route.log_slow_millis is not None and \
+                u_act["millis"] >= route.log_slow_millis:
+            return True
+        return random.random() < route.log_sample_rate
+
+    async def finish_log(
+            self,
+            u_act: dict,
+            scope: Scope,
+            route: BaseUserLogs,
+            capture: BodyCapture,
+    ):
+        if hasattr(scope.get("user"), 'id'):
+            u_act["user"] = scope["user"].id
+        if hasattr(scope.get("auth"), 'id'):
+            u_act["auth"] = scope["auth"].id
+        timings = timing.current()
+        u_act["millis"] = timings.total - (timings.get("log") or 0.0)
+        u_act["route"] = route.path
+        observe_request(
+            route.path, u_act["method"], u_act["result_status"],
+            u_act["millis"] / 1000,
+        )
+        route_stats.add(
+            u_act["created"], route.path, u_act["method"],
+            u_act["result_status"], u_act["millis"],
+        )
+        if not self.should_log(u_act, route):
+            return
+        with timings.measure("log"):
+            if u_act["url"] in route.exclude_url_path:
+                u_act["query_string"] = u_act["form_data"] = None
+                u_act["body"] = 'parameters removed for security'
+            elif route.log_body:
+                await self.capture_body(u_act, capture)
+            else:
+                u_act["form_data"] = None
+            self.timings_to_log(u_act, timings)
+        u_act["log_millis"] = timings.get("log")
+        self.log_writer.put(u_act)
+
+    @staticmethod
+    def timings_to_log(u_act: dict, timings: timing.Timings):
+        """
+        db overlaps auth and handler. serialize is everything
+        the route spends outside the endpoint: request parsing,
+        validation and serialization of the response.
+        """
+        u_act["auth_millis"] = timings.get("auth")
+        u_act["db_millis"] = timings.get("db")
+        u_act["handler_millis"] = timings.get("handler")
+        if timings.get("route") is not None:
+            u_act["serialize_millis"] = \
+                timings.get("route") - (timings.get("handler") or 0.0)
@@ -4,19 +4,21 @@ from fastapi.security.utils import get_authorization_scheme_param
 from jose import jwt, JWTError
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import aliased
 from starlette.authentication import (
     AuthCredentials, AuthenticationBackend, UnauthenticatedUser
 )
+from starlette.types import ASGIApp, Receive, Scope, Send
 from fastapi import Request
 
 from app.auth import models
-from app.database import async_session
-from app.settings import SECRET_KEY, ALGORITHM, CONCURRENT_CONNECTIONS
+from app.auth.cache import token_cache, epoch_cache, snapshot, restore
+from app import timing
+from app.database import RequestSession
+from app.settings import SECRET_KEY, ALGORITHM, CONCURRENT_CONNECTIONS, \
+    STATELESS_ACCESS_TOKENS
 
 
 class BasicAuthBackend(AuthenticationBackend):
-    a_s = async_session
 
     @staticmethod
     def get_user_token(request: Request) -> Optional[str]:
@@ -39,37 +41,118 @@ class BasicAuthBackend(AuthenticationBackend):
                     "email": str() as email,
                     "exp": int()
                 }:
-                    user = await session.scalars(
-                        select(models.User).where(
-                            models.User.id == user_id,
-                            models.User.email == email,
-                            models.User.is_active == True,
+                    digest = models.token_digest(token)
+                    if STATELESS_ACCESS_TOKENS:
+                        return await self.stateless_auth(
+                            digest, payload, session
                         )
-                    )
 
-                    if CONCURRENT_CONNECTIONS:
-                        stmt = select(models.AuthToken).filter(
-                            models.AuthToken.user_id == user_id,
-                            models.AuthToken.is_active == True,
-                        ).order_by(
-                            models.AuthToken.id.desc()
-                        ).limit(CONCURRENT_CONNECTIONS).subquery()
-                        a_auth = aliased(models.AuthToken, stmt)
-                        auth = await session.scalars(
-                            select(a_auth).filter(a_auth.access_token == token)
+                    cached = token_cache.get(digest)
+                    if cached:
+                        auth, user = cached
+                        return (
+                            restore(models.AuthToken, auth),
+                            restore(models.User, user),
                         )
-                    else:
-                        auth = await session.scalars(
-                            select(models.AuthToken).where(
-                                models.AuthToken.user_id == user_id,
-                                models.AuthToken.access_token == token,
-                                models.AuthToken.is_active == True,
-                            )
+
+                    queries = [
+                        models.User.id == user_id,
+                        models.User.email == email,
+                        models.User.is_active == True,
+                        models.AuthToken.access_token_hash == digest,
+                        models.AuthToken.is_active == True,
+                    ]
+                    if CONCURRENT_CONNECTIONS:
+                        queries.append(models.AuthToken.in_window == True)
+                    result = await session.execute(
+                        select(models.AuthToken, models.User).join(
+                            models.User,
+                            models.AuthToken.user_id == models.User.id,
+                        ).where(*queries)
+                    )
+                    auth, user = result.one_or_none() or (None, None)
+                    if auth and user:
+                        token_cache.set(
+                            digest, (snapshot(auth), snapshot(user)),
+                            tag=user.id,
                         )
-                    return auth.one_or_none(), user.one_or_none()
+                    return auth, user
 
         return AuthCredentials([]), UnauthenticatedUser
 
+    @staticmethod
+    async def stateless_auth(
+            digest: bytes, payload: dict, session: AsyncSession
+    ):
+        """
+        The signature is already checked, the token is valid while its
+        epoch is the current epoch of the user.
+        The database is read only for users missing from epoch_cache.
+        CONCURRENT_CONNECTIONS is not enforced in this mode.
+        """
+        match payload:
+            case {
+                "id": int() as user_id,
+                "email": str() as email,
+                "token_epoch": int() as token_epoch,
+                "sid": int() as auth_id,
+            }:
+                user = epoch_cache.get(user_id)
+                if user is None:
+                    db_user = await session.scalar(
+                        select(models.User).where(
+                            models.User.id == user_id,
+                            models.User.is_active == True,
+                        )
+                    )
+                    if not db_user:
+                        return None, None
+                    user = snapshot(db_user)
+                    epoch_cache.set(user_id, user)
+
+                if user["email"] != email or \
+                        user["token_epoch"] != token_epoch:
+                    return None, None
+                auth = {
+                    "id": auth_id,
+                    "user_id": user_id,
+                    "access_token_hash": digest,
+                    "is_active": True,
+                }
+                return (
+                    restore(models.AuthToken, auth),
+                    restore(models.User, user),
+                )
+        return None, None
+
     async def authenticate(self, request: Request):
-        async with self.a_s() as session:
-            return await self.main_auth(request, session)
+        # the handler goes on with the same session and the loaded user
+        return await self.main_auth(request, RequestSession.get(request))
+
+
+class LazyAuthenticationMiddleware:
+    """
+    Unlike starlette AuthenticationMiddleware, does not touch the token
+    and the database on the way in. request.user and request.auth stay
+    unauthenticated until the route calls `authenticate(request)`.
+    """
+
+    def __init__(self, app: ASGIApp, backend: AuthenticationBackend):
+        self.app = app
+        self.backend = backend
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] in ("http", "websocket"):
+            scope["auth"], scope["user"] = \
+                AuthCredentials([]), UnauthenticatedUser
+            scope["auth_backend"] = self.backend
+        await self.app(scope, receive, send)
+
+
+async def authenticate(request: Request):
+    """Resolves request.user and request.auth once per request."""
+    backend = request.scope.pop("auth_backend", None)
+    if backend:
+        with timing.measure("auth"):
+            request.scope["auth"], request.scope["user"] = \
+                await backend.authenticate(request)
@@ -0,0 +1,118 @@
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from app.settings import AUTH_CACHE_SIZE, AUTH_CACHE_TTL, \
+    AUTH_EPOCH_CACHE_SIZE, AUTH_EPOCH_TTL
+
+
+class TTLCache:
+    """
+    Bounded LRU mapping whose entries expire after `ttl` seconds.
+    Every entry may carry a tag (for example a user id), so that all
+    entries of one tag can be dropped at once.
+    A `maxsize` or `ttl` of 0 disables the cache.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self._tags: dict[Hashable, set] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.maxsize and self.ttl)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        expires, tag, value = item
+        if expires < time.monotonic():
+            self._remove(key)
+            self.evictions += 1
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any, tag: Hashable = None):
+        if not self.enabled:
+            return
+        if key in self._data:
+            self._remove(key)
+        self._data[key] = (time.monotonic() + self.ttl, tag, value)
+        if tag is not None:
+            self._tags.setdefault(tag, set()).add(key)
+        while len(self._data) > self.maxsize:
+            self._remove(next(iter(self._data)))
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable):
+        if key in self._data:
+            self._remove(key)
+            self.evictions += 1
+
+    def invalidate_tag(self, tag: Hashable):
+        for key in self._tags.get(tag, set()).copy():
+            self.invalidate(key)
+
+    def clear(self):
+        self._data.clear()
+        self._tags.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _remove(self, key: Hashable):
+        _, tag, _ = self._data.pop(key)
+        keys = self._tags.get(tag)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._tags[tag]
+
+
+def snapshot(instance) -> dict:
+    """Column values of an ORM instance, safe to keep between sessions."""
+    mapper = inspect(instance).mapper
+    return {
+        attr.key: getattr(instance, attr.key) for attr in mapper.column_attrs
+    }
+
+
+def restore(model, values: dict):
+    """
+    A fresh detached instance built from `snapshot` values.
+    Every request gets its own copy, so no ORM state is shared
+    between sessions.
+    """
+    instance = model(**values)
+    make_transient_to_detached(instance)
+    return instance
+
+
+# access_token digest -> (AuthToken snapshot, User snapshot), tagged by user id
+token_cache = TTLCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL)
+# user id -> User snapshot with token_epoch, used in stateless mode
+epoch_cache = TTLCache(maxsize=AUTH_EPOCH_CACHE_SIZE, ttl=AUTH_EPOCH_TTL)
+
+
+def forget_user(user_id: int):
+    """Drops everything this worker remembers about the user."""
+    token_cache.invalidate_tag(user_id)
+    epoch_cache.invalidate(user_id)
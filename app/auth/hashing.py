@@ -0,0 +1,124 @@
+import asyncio
+from concurrent.futures import Executor, ProcessPoolExecutor, \
+    ThreadPoolExecutor
+from typing import Callable
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from app.settings import PASSWORD_HASH_EXECUTOR, PASSWORD_HASH_WORKERS, \
+    PASSWORD_HASH_QUEUE, PASSWORD_HASH_SCHEMES, BCRYPT_ROUNDS, \
+    ARGON2_TIME_COST, ARGON2_MEMORY_COST, ARGON2_PARALLELISM
+
+
+def make_context(
+        schemes: list[str],
+        bcrypt_rounds: int = BCRYPT_ROUNDS,
+        argon2_time_cost: int = ARGON2_TIME_COST,
+        argon2_memory_cost: int = ARGON2_MEMORY_COST,
+        argon2_parallelism: int = ARGON2_PARALLELISM,
+) -> CryptContext:
+    """
+    The first scheme hashes new passwords, the rest are only verified.
+    A hash made by another scheme or with another cost needs an update.
+    """
+    return CryptContext(
+        schemes=schemes,
+        deprecated="auto",
+        bcrypt__default_rounds=bcrypt_rounds,
+        bcrypt__min_rounds=bcrypt_rounds,
+        bcrypt__max_rounds=bcrypt_rounds,
+        argon2__type="ID",
+        argon2__time_cost=argon2_time_cost,
+        argon2__memory_cost=argon2_memory_cost,
+        argon2__parallelism=argon2_parallelism,
+    )
+
+
+pwd_context = make_context(PASSWORD_HASH_SCHEMES)
+
+
+# Module level functions, so that a process pool can pickle them
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify(password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(password, hashed_password)
+
+
+def _verify_and_update(
+        password: str, hashed_password: str
+) -> tuple[bool, str | None]:
+    return pwd_context.verify_and_update(password, hashed_password)
+
+
+class PasswordHasher:
+    """
+    Runs password hashing outside the event loop.
+    At most `workers` calls run at once and `queue` more wait for a worker,
+    any call beyond that is rejected with 503 at once.
+    """
+
+    overloaded_exception = HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="The server is busy, try again later",
+        headers={"Retry-After": "1"},
+    )
+
+    def __init__(self, executor: str, workers: int, queue: int):
+        if executor not in ("thread", "process"):
+            raise Exception(
+                'PASSWORD_HASH_EXECUTOR must be "thread" or "process"'
+            )
+        self.executor_type = executor
+        self.workers = workers
+        self.limit = workers + queue
+        self.pending = 0
+        self._executor: Executor | None = None
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_type == "process":
+                self._executor = ProcessPoolExecutor(self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    self.workers, thread_name_prefix="password-hasher"
+                )
+        return self._executor
+
+    async def run(self, func: Callable, *args):
+        if self.pending >= self.limit:
+            raise self.overloaded_exception
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, func, *args
+            )
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self.run(_hash, password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self.run(_verify, password, hashed_password)
+
+    async def verify_and_update(
+            self, password: str, hashed_password: str
+    ) -> tuple[bool, str | None]:
+        """(valid, new hash if the stored one is outdated else None)"""
+        return await self.run(_verify_and_update, password, hashed_password)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    executor=PASSWORD_HASH_EXECUTOR,
+    workers=PASSWORD_HASH_WORKERS,
+    queue=PASSWORD_HASH_QUEUE,
+)
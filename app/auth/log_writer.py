@@ -0,0 +1,147 @@
+import asyncio
+import logging
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from app.auth.models import UsersActivity
+from app.auth.spool import ActivitySpool
+from app.auth.stats import route_stats, RouteStatsAggregator
+from app.database import async_session
+from app.settings import ACTIVITY_LOG_QUEUE_SIZE, ACTIVITY_LOG_BATCH_SIZE, \
+    ACTIVITY_LOG_FLUSH_INTERVAL, ACTIVITY_LOG_SINK
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityLogWriter:
+    """
+    Request logs are put in a bounded queue and written by a background
+    task with multi-row INSERTs, when `batch_size` records are collected
+    or `flush_interval` seconds have passed.
+    Records that do not fit in the queue are dropped and counted,
+    the request never waits for the database.
+    With a `spool` the batches are appended to its segments instead,
+    and SpoolLoader copies them into the database.
+    A batch rejected by a constraint is written row by row,
+    so that one bad record does not take the others with it.
+    The route_stats rollups are written after every batch.
+    """
+
+    a_s = async_session
+    u_act = UsersActivity
+    stats: RouteStatsAggregator = route_stats
+
+    def __init__(self, queue_size: int, batch_size: int, flush_interval: float,
+                 spool: ActivitySpool | None = None):
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool = spool
+        self.written = 0
+        self.dropped = 0
+        self._stopping = False
+
+    def new_record(self, **values) -> dict:
+        """All the columns are present, so that records make one INSERT."""
+        record = dict.fromkeys(
+            key for key in self.u_act.__table__.columns.keys() if key != "id"
+        )
+        record.update(values)
+        return record
+
+    def put(self, record: dict):
+        try:
+            self.queue.put_nowait(record)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def write(self, records: list[dict]) -> int:
+        """Returns the number of records written."""
+        if self.spool is not None:
+            self.spool.append(records)
+            return len(records)
+        async with self.a_s() as session:
+            try:
+                await session.execute(insert(self.u_act), records)
+                await session.commit()
+                return len(records)
+            except IntegrityError:
+                await session.rollback()
+            written = 0
+            for record in records:
+                try:
+                    async with session.begin_nested():
+                        await session.execute(insert(self.u_act), [record])
+                    written += 1
+                except IntegrityError:
+                    logger.warning(
+                        "Dropped an activity log of %s", record["url"],
+                        exc_info=True,
+                    )
+            await session.commit()
+            return written
+
+    async def collect(self) -> list[dict]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.flush_interval
+        batch = []
+        while len(batch) < self.batch_size:
+            if not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0 or self._stopping:
+                break
+            try:
+                batch.append(
+                    await asyncio.wait_for(self.queue.get(), timeout)
+                )
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def run(self):
+        """Works until `stop`, then writes out what is left in the queue."""
+        self._stopping = False
+        while not self._stopping or not self.queue.empty():
+            batch = await self.collect()
+            if self.spool is not None:
+                self.spool.rotate_if_due()
+            if batch:
+                try:
+                    written = await self.write(batch)
+                    self.written += written
+                    self.dropped += len(batch) - written
+                except Exception:
+                    self.dropped += len(batch)
+                    logger.exception(
+                        "Failed to write %s activity logs", len(batch)
+                    )
+            await self.write_stats()
+        await self.write_stats()
+        if self.spool is not None:
+            self.spool.rotate()
+
+    async def write_stats(self):
+        rows = self.stats.take()
+        if not rows:
+            return
+        try:
+            async with self.a_s() as session:
+                await self.stats.write(session, rows)
+                await session.commit()
+        except Exception:
+            self.stats.restore(rows)
+            logger.exception("Failed to write %s route stats", len(rows))
+
+    def stop(self):
+        self._stopping = True
+
+
+activity_log_writer = ActivityLogWriter(
+    queue_size=ACTIVITY_LOG_QUEUE_SIZE,
+    batch_size=ACTIVITY_LOG_BATCH_SIZE,
+    flush_interval=ACTIVITY_LOG_FLUSH_INTERVAL,
+    spool=ActivitySpool() if ACTIVITY_LOG_SINK == "spool" else None,
+)
@@ -1,29 +1,50 @@
 import datetime
+import hashlib
 from typing import Optional
 
-from sqlalchemy import ForeignKey, Index
+from sqlalchemy import ForeignKey, Index, Sequence, LargeBinary, true, \
+    false, event, DDL, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.database import Base
 from app.users.models import User
 
 
+def token_digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode()).digest()
+
+
 class AuthToken(Base):
 
     __tablename__ = "auth"
 
-    id: Mapped[int] = mapped_column(primary_key=True, index=True)
+    # login takes the id before the row is inserted, to put it in the tokens
+    id_seq = Sequence("auth_id_seq")
+
+    id: Mapped[int] = mapped_column(
+        id_seq,
+        primary_key=True,
+        index=True,
+        server_default=id_seq.next_value(),
+    )
     user_id = mapped_column(ForeignKey(User.id))
-    access_token: Mapped[str] = mapped_column(
-       unique=True, nullable=False
+    # sha256 of the tokens, see token_digest
+    access_token_hash: Mapped[bytes] = mapped_column(
+        LargeBinary(32), unique=True, index=True, nullable=False
     )
     last_update: Mapped[datetime.datetime] = mapped_column(
         default=datetime.datetime.now,
     )
-    refresh_token: Mapped[str] = mapped_column(
-        unique=True, nullable=False
+    refresh_token_hash: Mapped[bytes] = mapped_column(
+        LargeBinary(32), unique=True, index=True, nullable=False
     )
     is_active: Mapped[bool] = mapped_column(default=True, nullable=False)
+    # One of the newest CONCURRENT_CONNECTIONS active authorizations
+    # of the user, kept by update_session_window
+    in_window: Mapped[bool] = mapped_column(
+        default=True, server_default=true(), nullable=False
+    )
     created: Mapped[datetime.datetime] = mapped_column(
         default=datetime.datetime.now,
     )
@@ -31,12 +52,32 @@ class AuthToken(Base):
 
 
 class UsersActivity(Base):
+    """
+    Partitioned by created, the partitions are maintained
+    by app.auth.tasks.ActivityPartitionManager.
+    """
 
     __tablename__ = "users_activity"
+    # keyset pagination of the admin API by (created, id) after every filter
+    __table_args__ = (
+        Index("ix_users_activity_created_id", "created", "id"),
+        Index("ix_users_activity_user_created_id", "user", "created", "id"),
+        Index("ix_users_activity_auth_created_id", "auth", "created", "id"),
+        Index("ix_users_activity_url_created_id", "url", "created", "id"),
+        Index(
+            "ix_users_activity_result_status_created_id",
+            "result_status", "created", "id",
+        ),
+        {"postgresql_partition_by": "RANGE (created)"},
+    )
 
-    id: Mapped[int] = mapped_column(primary_key=True, index=True)
+    id: Mapped[int] = mapped_column(
+        primary_key=True, index=True, autoincrement=True,
+    )
 
     url: Mapped[str] = mapped_column()
+    # path template of the route, e.g. /posts/{post_id}
+    route: Mapped[Optional[str]] = mapped_column()
     addr: Mapped[str] = mapped_column()
     port: Mapped[int] = mapped_column()
     method: Mapped[str] = mapped_column()
@@ -46,17 +87,59 @@ class UsersActivity(Base):
     body: Mapped[Optional[str]] = mapped_column()
     query_string: Mapped[Optional[str]] = mapped_column()
     form_data: Mapped[Optional[str]] = mapped_column()
+    # body or form_data is cut to ACTIVITY_LOG_BODY_LIMIT
+    body_truncated: Mapped[bool] = mapped_column(
+        default=False, server_default=false(),
+    )
 
     user = mapped_column(ForeignKey(User.id))
-    auth = mapped_column(ForeignKey(AuthToken.id))
+    # AuthToken.id, not a foreign key: auth rows are purged by
+    # AuthTokenCleaner, the logs keep the id of the session
+    auth: Mapped[Optional[int]] = mapped_column()
 
     result_status: Mapped[Optional[int]] = mapped_column()
     result_len: Mapped[Optional[int]] = mapped_column()
     result_content: Mapped[Optional[str]] = mapped_column()
     millis: Mapped[Optional[float]] = mapped_column()
+    # stages of millis, see app.timing
+    auth_millis: Mapped[Optional[float]] = mapped_column()
+    db_millis: Mapped[Optional[float]] = mapped_column()
+    handler_millis: Mapped[Optional[float]] = mapped_column()
+    serialize_millis: Mapped[Optional[float]] = mapped_column()
+    log_millis: Mapped[Optional[float]] = mapped_column()
 
     traceback: Mapped[Optional[str]] = mapped_column()
 
     created: Mapped[datetime.datetime] = mapped_column(
-        default=datetime.datetime.now,
+        primary_key=True, default=datetime.datetime.now,
     )
+
+
+event.listen(
+    UsersActivity.__table__,
+    "after_create",
+    DDL(
+        "CREATE TABLE users_activity_default "
+        "PARTITION OF users_activity DEFAULT"
+    ).execute_if(dialect="postgresql"),
+)
+
+
+class RouteStats(Base):
+    """
+    Per-minute rollups of the requests, see app.auth.stats.
+    status 0 - the response was not sent.
+    """
+
+    __tablename__ = "route_stats"
+
+    minute: Mapped[datetime.datetime] = mapped_column(primary_key=True)
+    route: Mapped[str] = mapped_column(primary_key=True)
+    method: Mapped[str] = mapped_column(primary_key=True)
+    status: Mapped[int] = mapped_column(primary_key=True)
+
+    count: Mapped[int] = mapped_column()
+    total_millis: Mapped[float] = mapped_column()
+    min_millis: Mapped[float] = mapped_column()
+    max_millis: Mapped[float] = mapped_column()
+    sketch: Mapped[list[int]] = mapped_column(ARRAY(Integer))
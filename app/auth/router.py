@@ -2,22 +2,21 @@ from typing import Annotated
 
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordRequestForm
-from passlib.context import CryptContext
 
 from sqlalchemy import select, exc, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from .router_class import RouteAuth, RouteWithOutAuth
-from .schemas import get_new_token
+from .cache import token_cache, forget_user
+from .hashing import password_hasher
+from .router_class import RouteAuth, RouteAnonymous
+from .schemas import get_new_token, update_session_window
 from .swagger_auth import *
 from ..database import get_session
+from ..settings import CONCURRENT_CONNECTIONS, STATELESS_ACCESS_TOKENS
 from . import schemas, models
 from ..users.schemas import User, UserCreate, UserToken
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-
 router_auth = APIRouter(
     prefix="/auth",
     tags=["auth"],
@@ -27,7 +26,7 @@ router_auth = APIRouter(
 router_with_out_auth = APIRouter(
     prefix="/auth",
     tags=["auth"],
-    route_class=RouteWithOutAuth,
+    route_class=RouteAnonymous,
 )
 
 
@@ -45,7 +44,7 @@ async def register(
     db_user = models.User(
         username=form_data.username,
         email=form_data.email,
-        hashed_password=pwd_context.hash(form_data.password)
+        hashed_password=await password_hasher.hash(form_data.password)
     )
     try:
         session.add(db_user)
@@ -76,21 +75,38 @@ async def login(
         )
     )
     user: models.User = get_user.one_or_none()
-    if not user or not pwd_context.verify(
+    if user:
+        valid, new_hash = await password_hasher.verify_and_update(
             form_data.password, user.hashed_password
-    ):
+        )
+    if not user or not valid:
         raise HTTPException(
             status_code=404,
             detail="Invalid username or password",
         )
+    if new_hash:
+        # stored in the same commit as the new authorization
+        user.hashed_password = new_hash
 
+    auth_id = await session.scalar(
+        select(models.AuthToken.id_seq.next_value())
+    )
     token = schemas.create_token(
         user=UserToken.model_validate(user),
+        auth_id=auth_id,
     )
     session.add(models.AuthToken(
-        **token.model_dump(exclude=("token_type",))
+        id=token.id,
+        user_id=token.user_id,
+        access_token_hash=models.token_digest(token.access_token),
+        refresh_token_hash=models.token_digest(token.refresh_token),
     ))
+    await session.flush()
+    await update_session_window(session, user.id)
     await session.commit()
+    if CONCURRENT_CONNECTIONS:
+        # the new authorization may push the oldest one out of the window
+        token_cache.invalidate_tag(user.id)
     return token
 
 
@@ -109,6 +125,9 @@ async def create_token(
     allows to receive a new access_token. \n
     When a new access_token is obtained,
     the old access_token from the current authorization is no longer valid.
+    \n
+    Of concurrent requests with one refresh_token only the first gets
+    201, the others get 409 and no access_token.
     """
     return await get_new_token(form_data.refresh_token, session=session)
 
@@ -127,7 +146,19 @@ async def logout(
     result = result.one_or_none()
     if result:
         result.is_active = False
-        await session.commit()
+        await session.flush()
+        await update_session_window(session, request.user.id)
+    if STATELESS_ACCESS_TOKENS:
+        # without the auth table lookup only a new epoch revokes the token
+        await session.execute(
+            update(models.User).where(
+                models.User.id == request.user.id
+            ).values(token_epoch=models.User.token_epoch + 1)
+        )
+    await session.commit()
+    token_cache.invalidate(request.auth.access_token_hash)
+    if STATELESS_ACCESS_TOKENS:
+        forget_user(request.user.id)
 
     return
 
@@ -145,8 +176,11 @@ async def change_password(
     """
     When you change the password, all other access_token and refresh_token
     from the authorization will be reset except for the current authorization.
+    \n
+    With stateless access tokens the current access_token is reset too,
+    a new one is received by the refresh_token of the current authorization.
     """
-    if not pwd_context.verify(
+    if not await password_hasher.verify(
         form_data.old_password, request.user.hashed_password
     ):
         raise HTTPException(
@@ -157,7 +191,8 @@ async def change_password(
     user = (await session.execute(select(models.User).where(
         models.User.id == request.user.id
     ))).scalars().one_or_none()
-    user.hashed_password = pwd_context.hash(form_data.new_password)
+    user.hashed_password = await password_hasher.hash(form_data.new_password)
+    user.token_epoch = models.User.token_epoch + 1
 
     stmt = (
         update(models.AuthToken).
@@ -166,7 +201,9 @@ async def change_password(
         values(is_active=False)
     )
     await session.execute(stmt)
+    await update_session_window(session, request.user.id)
 
     await session.commit()
+    forget_user(request.user.id)
 
     return "Password changed successfully"
@@ -1,9 +1,8 @@
-import datetime
+import asyncio
+import functools
 import traceback
 from typing import Callable
 
-from urllib.parse import unquote
-
 from fastapi import Request, Response, status, Depends
 from fastapi.exceptions import RequestValidationError, \
     ResponseValidationError, HTTPException
@@ -11,27 +10,45 @@ from fastapi.routing import APIRoute
 from fastapi.security import OAuth2PasswordBearer
 
 from app.auth import models
-from app.auth.models import UsersActivity
-from app.database import async_session
-from sqlalchemy.ext.asyncio import AsyncSession
+from app.auth.auth import authenticate
+from app.database import RequestSession
+from app import timing
 
-from app.settings import DEBUG
+from app.settings import DEBUG, ACTIVITY_LOG_SAMPLE_RATE, \
+    ACTIVITY_LOG_SLOW_MILLIS, ACTIVITY_LOG_BODY
 
 
 class BaseUserLogs(APIRoute):
+    """
+    Authentication and error handling of the routes. The requests are
+    logged by app.auth.activity.ActivityLogMiddleware, by the policy
+    of the route class.
+    """
 
-    u_act = UsersActivity
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+    permission_exception = HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail="Not enough permissions",
+    )
     exclude_url_path: tuple[str] = ()
     required_auth: bool = False
+    required_superuser: bool = False
+    # False - the route never looks at request.user and request.auth
+    identity: bool = True
     http_response: dict = None
     # Anything from fastapi.security
     reuseable_oauth = None
-    a_s = async_session
+    # Logging policy: the share of logged requests, except the ones
+    # with result_status >= log_error_status or slower than log_slow_millis,
+    # which are always logged
+    log_sample_rate: float = ACTIVITY_LOG_SAMPLE_RATE
+    log_error_status: int = status.HTTP_400_BAD_REQUEST
+    log_slow_millis: float | None = ACTIVITY_LOG_SLOW_MILLIS
+    log_body: bool = ACTIVITY_LOG_BODY
 
     def get_route_handler(self) -> Callable:
         if self.required_auth and self.reuseable_oauth:
@@ -49,112 +66,72 @@ class BaseUserLogs(APIRoute):
             else:
                 self.responses = self.http_response
 
+        self.time_endpoint()
         original_route_handler = super().get_route_handler()
 
         async def custom_route_handler(request: Request) -> Response:
-            async with self.a_s() as db:
-                u_act = await self.create_log(db, request)
-                try:
-                    if self.required_auth and (not isinstance(
-                            request.user, models.User
-                    ) or not isinstance(
-                        request.auth, models.AuthToken
-                    )):
-                        raise self.credentials_exception
-
-                    response: Response = await original_route_handler(request)
-                except Exception as exc:
-                    formatted_lines = traceback.format_exc().splitlines()[-5:-1]
-                    logs_errors = ''.join(formatted_lines)
-                    if isinstance(exc, RequestValidationError) or \
-                            isinstance(exc, ResponseValidationError):
-                        await self.finish_log(
-                            db, u_act, request, logs_errors=logs_errors
-                        )
-                        raise exc
-                    elif isinstance(exc, HTTPException):
-                        # manual errors write in u_act.content
-                        response: Response = Response(
-                            status_code=exc.status_code,
-                            headers=exc.headers,
-                            media_type=exc.detail
-                        )
-                        await self.finish_log(
-                            db, u_act, request, response
-                        )
-                        raise exc
-                    else:
-                        if DEBUG:
-                            raise exc
-                        response: Response = Response(
-                            status_code=500,
-                            content='Server error'
-                        )
-                        await self.finish_log(
-                            db, u_act, request, response, logs_errors
-                        )
-                        return response
-
-                await self.finish_log(db, u_act, request, response)
-                return response
+            # the record of ActivityLogMiddleware, if the request is logged
+            u_act: dict | None = request.scope.get("activity")
+            try:
+                if self.identity or self.required_auth:
+                    await authenticate(request)
+                if self.required_auth and (not isinstance(
+                        request.user, models.User
+                ) or not isinstance(
+                    request.auth, models.AuthToken
+                )):
+                    raise self.credentials_exception
+                if self.required_superuser and \
+                        not request.user.is_superuser:
+                    raise self.permission_exception
+
+                with timing.measure("route"):
+                    response: Response = await original_route_handler(
+                        request
+                    )
+            except HTTPException as exc:
+                # manual errors write in u_act.content
+                if u_act is not None:
+                    u_act["result_content"] = str(exc.detail)
+                raise exc
+            except Exception as exc:
+                if u_act is not None:
+                    formatted_lines = \
+                        traceback.format_exc().splitlines()[-5:-1]
+                    u_act["traceback"] = ''.join(formatted_lines)
+                if isinstance(exc, RequestValidationError) or \
+                        isinstance(exc, ResponseValidationError) or DEBUG:
+                    raise exc
+                return Response(
+                    status_code=500,
+                    content='Server error'
+                )
+            finally:
+                await RequestSession.close(request)
+                # the form is never parsed for the log,
+                # it is taken only if the handler has already parsed it
+                form_data = getattr(request, '_form', None)
+                if u_act is not None and form_data is not None:
+                    u_act["form_data"] = str(form_data.multi_items())
+
+            return response
 
         return custom_route_handler
 
-    async def create_log(
-            self, db: AsyncSession, request: Request
-    ) -> UsersActivity:
-        u_act = self.u_act(
-            url=request.url.path,
-            method=request.method,
-            addr=request.client.host,
-            port=request.client.port,
-            user_agent=request.headers.get('user-agent'),
-            content_type=request.headers.get('content-type'),
-            content_length=request.headers.get('content-length'),
-        )
-        if request.url.path not in self.exclude_url_path:
-            if request.query_params:
-                u_act.query_string = str(request.query_params)
-            if request.headers.get('content-type'):
-                match request.headers['content-type'].split(';'):
-                    case ['multipart/form-data', *_]:
-                        form_data = await request.form()
-                        u_act.form_data = str(form_data.multi_items())
-                    case ['application/x-www-form-urlencoded', *_]:
-                        u_act.body = unquote((await request.body()).decode())
-                    case ['application/octet-stream', *_]:
-                        pass
-                    case _:
-                        u_act.body = (await request.body()).decode()
-        else:
-            u_act.body = 'parameters removed for security'
-
-        db.add(u_act)
-        await db.commit()
-        await db.refresh(u_act)
-        return u_act
-
-    @staticmethod
-    async def finish_log(
-            db: AsyncSession,
-            u_act: UsersActivity,
-            request: Request,
-            result: Response | None = None,
-            logs_errors: str | None = None
-    ):
-        if hasattr(request.user, 'id'):
-            u_act.user = request.user.id
-        if hasattr(request.auth, 'id'):
-            u_act.auth = request.auth.id
-        if result:
-            u_act.result_status = result.status_code
-            u_act.result_len = len(result.body)
-            u_act.result_content = result.media_type
-        u_act.traceback = logs_errors
-        time_delta = datetime.datetime.now() - u_act.created
-        u_act.millis = \
-            (time_delta.seconds * 10 ** 6 + time_delta.microseconds) / 1000
-        await db.commit()
+    def time_endpoint(self):
+        """The endpoint itself is measured as the "handler" stage."""
+        endpoint = self.dependant.call
+        if not asyncio.iscoroutinefunction(endpoint) or \
+                hasattr(endpoint, "__timed__"):
+            return
+
+        @functools.wraps(endpoint)
+        async def timed_endpoint(*args, **kwargs):
+            with timing.measure("handler"):
+                return await endpoint(*args, **kwargs)
+
+        timed_endpoint.__timed__ = True
+        self.dependant.call = timed_endpoint
 
 
 class RouteAuth(BaseUserLogs):
@@ -189,3 +166,22 @@ class RouteAuth(BaseUserLogs):
 class RouteWithOutAuth(BaseUserLogs):
     exclude_url_path = ('/auth/register', '/auth/login')
     required_auth: bool = False
+
+
+class RouteAnonymous(RouteWithOutAuth):
+    identity: bool = False
+
+
+class RouteAdmin(RouteAuth):
+    required_superuser: bool = True
+    http_response = {
+        **RouteAuth.http_response,
+        403: {
+            "description": "Forbidden",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Not enough permissions"}
+                }
+            },
+        },
+    }
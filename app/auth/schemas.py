@@ -1,19 +1,24 @@
 import datetime
+import uuid
+from typing import Optional
 
 from fastapi import HTTPException, status
 from jose import jwt, JWTError
 from pydantic import BaseModel, Field, model_validator
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
 
 from app import settings
 from app.auth import models
+from app.auth.cache import token_cache
 from app.users.schemas import UserToken
 
 SECRET_KEY = settings.SECRET_KEY
 ALGORITHM = settings.ALGORITHM
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.ACCESS_TOKEN_EXPIRE_MINUTES
 REFRESH_TOKEN_EXPIRE_HOURS = settings.REFRESH_TOKEN_EXPIRE_HOURS
+CONCURRENT_CONNECTIONS = settings.CONCURRENT_CONNECTIONS
 
 
 class ChangePassword(BaseModel):
@@ -54,12 +59,26 @@ class RespToken(TokenBase, RefreshTokenBase):
 
 
 class Token(TokenBase, RefreshTokenBase):
+    # AuthToken.id, if it was taken before the row is inserted
+    id: Optional[int] = None
     user_id: int
 
 
+def encode_token(
+        user: UserToken,
+        expire: datetime.datetime,
+        auth_id: Optional[int] = None,
+) -> str:
+    claims = {**user.model_dump(), "exp": expire, "jti": uuid.uuid4().hex}
+    if auth_id:
+        claims["sid"] = auth_id
+    return jwt.encode(claims, SECRET_KEY, algorithm=ALGORITHM)
+
+
 def create_token(
         user: UserToken,
-        refresh_token: str = None
+        refresh_token: str = None,
+        auth_id: Optional[int] = None,
 ):
     if ACCESS_TOKEN_EXPIRE_MINUTES:
         expire = datetime.datetime.utcnow() + datetime.timedelta(
@@ -70,12 +89,9 @@ def create_token(
 
     if refresh_token:
         return Token(
+            id=auth_id,
             user_id=user.id,
-            access_token=jwt.encode(
-                {**user.model_dump(), "exp": expire},
-                SECRET_KEY,
-                algorithm=ALGORITHM
-            ),
+            access_token=encode_token(user, expire, auth_id),
             refresh_token=refresh_token,
         )
 
@@ -83,17 +99,10 @@ def create_token(
         hours=REFRESH_TOKEN_EXPIRE_HOURS
     )
     return Token(
+        id=auth_id,
         user_id=user.id,
-        access_token=jwt.encode(
-            {**user.model_dump(), "exp": expire},
-            SECRET_KEY,
-            algorithm=ALGORITHM
-        ),
-        refresh_token=jwt.encode(
-            {**user.model_dump(), "exp": ref_expire},
-            SECRET_KEY,
-            algorithm=ALGORITHM
-        ),
+        access_token=encode_token(user, expire, auth_id),
+        refresh_token=encode_token(user, ref_expire, auth_id),
     )
 
 
@@ -105,6 +114,10 @@ async def get_new_token(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid refresh token"
         )
+    concurrent_refresh = HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="The access token was refreshed by a concurrent request",
+    )
 
     try:
         payload = jwt.decode(refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
@@ -118,36 +131,128 @@ async def get_new_token(
             "email": str() as email,
             "exp": int()
         }:
-            user = await session.scalars(
-                select(models.User).where(
-                    models.User.id == user_id,
-                    models.User.username == username,
-                    models.User.email == email,
-                    models.User.is_active == True,
-                )
-            )
-            user = user.one_or_none()
-            if not user:
-                raise invalid_refresh_token
-
-            auth = await session.scalars(
-                select(models.AuthToken).where(
-                    models.AuthToken.user_id == user.id,
-                    models.AuthToken.refresh_token == refresh_token,
-                    models.AuthToken.is_active == True,
-                )
+            user = UserToken(
+                id=user_id,
+                username=username,
+                email=email,
+                token_epoch=payload.get("token_epoch", 0),
             )
-            auth = auth.one_or_none()
-            if not auth:
-                raise invalid_refresh_token
-
+            auth_id = payload.get("sid")
             new_token: Token = create_token(
-                user=UserToken.model_validate(user),
+                user=user,
                 refresh_token=refresh_token,
+                auth_id=auth_id,
             )
-            auth.access_token = new_token.access_token
-            auth.last_update = datetime.datetime.now()
+            result = await session.execute(
+                rotate_access_token(refresh_token, new_token, user)
+            )
+            row = result.one_or_none()
+            if not row:
+                valid = await session.scalar(
+                    select(models.AuthToken.__table__.c.id).where(
+                        *refresh_conditions(refresh_token, user)
+                    )
+                )
+                if valid:
+                    raise concurrent_refresh
+                raise invalid_refresh_token
+
+            if row.token_epoch != user.token_epoch or row.id != auth_id:
+                # A new epoch was started after the login (or the token
+                # has no sid), the access token is issued once more.
+                user.token_epoch = row.token_epoch
+                new_token = create_token(
+                    user=user,
+                    refresh_token=refresh_token,
+                    auth_id=row.id,
+                )
+                await session.execute(
+                    update(models.AuthToken).where(
+                        models.AuthToken.id == row.id
+                    ).values(
+                        access_token_hash=models.token_digest(
+                            new_token.access_token
+                        ),
+                    )
+                )
             await session.commit()
+            token_cache.invalidate_tag(user_id)
             return new_token
         case _:
             raise invalid_refresh_token
+
+
+def refresh_conditions(refresh_token: str, user: UserToken) -> list:
+    """The refresh_token is active and its user is unchanged."""
+    auth = models.AuthToken.__table__
+    users = models.User.__table__
+    return [
+        auth.c.refresh_token_hash == models.token_digest(refresh_token),
+        auth.c.is_active == True,
+        auth.c.user_id == user.id,
+        auth.c.user_id == users.c.id,
+        users.c.username == user.username,
+        users.c.email == user.email,
+        users.c.is_active == True,
+    ]
+
+
+def rotate_access_token(refresh_token: str, new_token: Token, user: UserToken):
+    """
+    A single UPDATE ... FROM users ... RETURNING that checks
+    the refresh_token and the user and stores the new access_token.
+    Compare-and-set on last_update: of concurrent refreshes of one
+    refresh_token, the one that takes the row lock first wins. The
+    others wait for it, find last_update changed and update no row.
+    Core tables, the ORM can not return columns of the joined table.
+    """
+    auth = models.AuthToken.__table__
+    users = models.User.__table__
+    # read once, by the snapshot of the statement
+    prior = auth.alias("prior")
+    seen = select(prior.c.last_update).where(
+        prior.c.refresh_token_hash == models.token_digest(refresh_token),
+    ).scalar_subquery()
+    return update(auth).where(
+        *refresh_conditions(refresh_token, user),
+        auth.c.last_update.is_not_distinct_from(seen),
+    ).values(
+        access_token_hash=models.token_digest(new_token.access_token),
+        last_update=datetime.datetime.now(),
+    ).returning(auth.c.id, users.c.token_epoch)
+
+
+async def update_session_window(session: AsyncSession, user_id: int):
+    """
+    Marks the newest CONCURRENT_CONNECTIONS active authorizations
+    of the user as in_window, so that main_auth checks a single flag.
+    Is called whenever the set of active authorizations changes,
+    under the lock of the user row.
+    """
+    if not CONCURRENT_CONNECTIONS:
+        return
+    # concurrent logins of the user recompute the window one after another,
+    # the UPDATE below then sees the authorizations committed meanwhile.
+    # FOR NO KEY UPDATE: FOR UPDATE would conflict with the FOR KEY SHARE
+    # lock that the foreign key check of every new auth row holds
+    await session.execute(
+        select(models.User.id).where(
+            models.User.id == user_id
+        ).with_for_update(key_share=True)
+    )
+    newest = aliased(models.AuthToken)
+    await session.execute(
+        update(models.AuthToken).where(
+            models.AuthToken.user_id == user_id,
+            models.AuthToken.is_active == True,
+        ).values(
+            in_window=models.AuthToken.id.in_(
+                select(newest.id).where(
+                    newest.user_id == user_id,
+                    newest.is_active == True,
+                ).order_by(
+                    newest.id.desc()
+                ).limit(CONCURRENT_CONNECTIONS)
+            )
+        )
+    )
@@ -0,0 +1,211 @@
+import asyncio
+import datetime
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+from app.auth.models import UsersActivity
+from app.database import async_session
+from app.settings import ACTIVITY_LOG_SPOOL_DIR, \
+    ACTIVITY_LOG_SPOOL_SEGMENT_SIZE, ACTIVITY_LOG_SPOOL_SEGMENT_SECONDS, \
+    ACTIVITY_LOG_SPOOL_LOAD_INTERVAL, ACTIVITY_LOG_SPOOL_STALE_SECONDS
+
+logger = logging.getLogger(__name__)
+
+OPEN_SUFFIX = ".open"
+CLOSED_SUFFIX = ".jsonl"
+LOADING_SUFFIX = ".loading"
+
+
+class ActivitySpool:
+    """
+    Append-only JSONL segments of activity records, one line per record.
+    A segment is written as `*.open` and renamed to `*.jsonl` when it
+    reaches `segment_size` bytes or `segment_seconds` of age, only
+    closed segments are read by SpoolLoader.
+    """
+
+    def __init__(
+            self,
+            directory: str = ACTIVITY_LOG_SPOOL_DIR,
+            segment_size: int = ACTIVITY_LOG_SPOOL_SEGMENT_SIZE,
+            segment_seconds: float = ACTIVITY_LOG_SPOOL_SEGMENT_SECONDS,
+    ):
+        self.directory = Path(directory)
+        self.segment_size = segment_size
+        self.segment_seconds = segment_seconds
+        self._file = None
+        self._path: Path | None = None
+        self._opened = 0.0
+
+    def _open(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        name = f"activity-{time.time_ns()}-{os.getpid()}{CLOSED_SUFFIX}"
+        self._path = self.directory / name
+        self._file = open(
+            self._path.with_name(name + OPEN_SUFFIX), "a",
+            encoding="utf-8", buffering=1024 * 1024,
+        )
+        self._opened = time.monotonic()
+
+    def append(self, records: list[dict]):
+        if self._file is None:
+            self._open()
+        self._file.write("".join(
+            json.dumps(record, default=str) + "\n" for record in records
+        ))
+        self._file.flush()
+        if self._file.tell() >= self.segment_size:
+            self.rotate()
+
+    def rotate_if_due(self):
+        if self._file is not None and \
+                time.monotonic() - self._opened >= self.segment_seconds:
+            self.rotate()
+
+    def rotate(self):
+        """Closes the current segment, the next append opens a new one."""
+        if self._file is None:
+            return
+        self._file.close()
+        os.rename(self._path.with_name(self._path.name + OPEN_SUFFIX),
+                  self._path)
+        self._file = None
+
+
+class SpoolLoader:
+    """
+    Loads closed spool segments into users_activity by COPY and deletes
+    them. A segment is claimed by renaming, so several loaders may share
+    the directory.
+    Recovery after crashes: a `*.loading` segment older than
+    `stale_seconds` is put back in the queue, and `*.open` segments of
+    dead processes are closed, a cut last line is skipped. A loader that
+    dies between the COPY commit and the delete loads its segment twice.
+    The pid check assumes the writers run on the same host.
+    """
+
+    a_s = async_session
+    u_act = UsersActivity
+    columns = [
+        key for key in UsersActivity.__table__.columns.keys() if key != "id"
+    ]
+
+    def __init__(self, directory: str = ACTIVITY_LOG_SPOOL_DIR,
+                 interval: float = ACTIVITY_LOG_SPOOL_LOAD_INTERVAL,
+                 stale_seconds: float = ACTIVITY_LOG_SPOOL_STALE_SECONDS):
+        self.directory = Path(directory)
+        self.interval = interval
+        self.stale_seconds = stale_seconds
+        self.loaded = 0
+
+    def read_segment(self, path: Path) -> list[dict]:
+        records = []
+        with open(path, encoding="utf-8") as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    # the writer died in the middle of the line
+                    logger.warning("Skipped a broken line of %s", path)
+        for record in records:
+            record["created"] = datetime.datetime.fromisoformat(
+                record["created"]
+            )
+        return records
+
+    async def copy(self, records: list[dict]):
+        async with self.a_s() as session:
+            connection = await session.connection()
+            raw = await connection.get_raw_connection()
+            await raw.driver_connection.copy_records_to_table(
+                self.u_act.__tablename__,
+                records=[
+                    tuple(record.get(key) for key in self.columns)
+                    for record in records
+                ],
+                columns=self.columns,
+            )
+            await session.commit()
+
+    async def load_segment(self, path: Path) -> int:
+        claimed = path.with_name(path.name + LOADING_SUFFIX)
+        try:
+            os.rename(path, claimed)
+        except FileNotFoundError:
+            # claimed by another loader
+            return 0
+        # the age of the claim, see recover
+        os.utime(claimed)
+        try:
+            records = self.read_segment(claimed)
+            if records:
+                await self.copy(records)
+        except Exception:
+            # back in the queue for the next run
+            os.rename(claimed, path)
+            raise
+        os.remove(claimed)
+        return len(records)
+
+    @staticmethod
+    def writer_alive(path: Path) -> bool:
+        # activity-<time_ns>-<pid>.jsonl.open, see ActivitySpool._open
+        pid = int(path.name.split(".")[0].rsplit("-", 1)[1])
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def recover(self):
+        """Puts the segments left by dead processes in the queue."""
+        for path in self.directory.glob(f"*{CLOSED_SUFFIX}{OPEN_SUFFIX}"):
+            if not self.writer_alive(path):
+                logger.warning("Closing the orphaned spool segment %s", path)
+                self.put_back(path, OPEN_SUFFIX)
+        stale = time.time() - self.stale_seconds
+        for path in self.directory.glob(f"*{CLOSED_SUFFIX}{LOADING_SUFFIX}"):
+            try:
+                claimed = path.stat().st_mtime
+            except FileNotFoundError:
+                continue
+            if claimed < stale:
+                logger.warning("Reloading the stale spool segment %s", path)
+                self.put_back(path, LOADING_SUFFIX)
+
+    @staticmethod
+    def put_back(path: Path, suffix: str):
+        try:
+            os.rename(path, path.with_name(path.name[:-len(suffix)]))
+        except FileNotFoundError:
+            # recovered by another loader
+            pass
+
+    async def load(self) -> int:
+        if not self.directory.exists():
+            return 0
+        self.recover()
+        total = 0
+        for path in sorted(self.directory.glob(f"*{CLOSED_SUFFIX}")):
+            total += await self.load_segment(path)
+        self.loaded += total
+        return total
+
+    async def run(self):
+        while True:
+            try:
+                await self.load()
+            except Exception:
+                logger.exception("Failed to load activity spool")
+            await asyncio.sleep(self.interval)
+
+
+if __name__ == "__main__":
+    asyncio.run(SpoolLoader().run())
@@ -0,0 +1,123 @@
+import datetime
+import math
+
+from sqlalchemy import literal_column
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth.models import RouteStats
+
+# Latency sketch: bucket i counts the requests of at most
+# SKETCH_MIN * SKETCH_GAMMA ** i milliseconds, the last one everything
+# slower. Sketches of any rows are merged by adding them element-wise,
+# quantiles are accurate within SKETCH_GAMMA.
+SKETCH_MIN = 0.1
+SKETCH_GAMMA = 1.25
+SKETCH_SIZE = 64
+
+
+def sketch_index(millis: float) -> int:
+    if millis <= SKETCH_MIN:
+        return 0
+    index = math.ceil(math.log(millis / SKETCH_MIN, SKETCH_GAMMA))
+    return min(index, SKETCH_SIZE - 1)
+
+
+def merge_sketches(first: list[int], second: list[int]) -> list[int]:
+    return [a + b for a, b in zip(first, second)]
+
+
+def sketch_quantile(sketch: list[int], quantile: float) -> float | None:
+    """Upper bound of the bucket holding `quantile` of the requests."""
+    count = sum(sketch)
+    if not count:
+        return None
+    rank = quantile * count
+    cumulative = 0
+    for index, bucket in enumerate(sketch):
+        cumulative += bucket
+        if cumulative >= rank:
+            return SKETCH_MIN * SKETCH_GAMMA ** index
+    return SKETCH_MIN * SKETCH_GAMMA ** (SKETCH_SIZE - 1)
+
+
+class RouteStatsAggregator:
+    """
+    Per-minute rollups of the requests of this worker, accumulated
+    in memory and added to route_stats by ActivityLogWriter.
+    Every request is counted, sampled out of users_activity or not.
+    """
+
+    r_stats = RouteStats
+
+    def __init__(self):
+        self.pending: dict[tuple, dict] = {}
+
+    def add(self, created: datetime.datetime, route: str, method: str,
+            status: int | None, millis: float):
+        minute = created.replace(second=0, microsecond=0)
+        key = (minute, route, method, status or 0)
+        sketch = [0] * SKETCH_SIZE
+        sketch[sketch_index(millis)] = 1
+        self.merge(key, {
+            "count": 1,
+            "total_millis": millis,
+            "min_millis": millis,
+            "max_millis": millis,
+            "sketch": sketch,
+        })
+
+    def merge(self, key: tuple, values: dict):
+        row = self.pending.get(key)
+        if row is None:
+            self.pending[key] = values
+            return
+        row["count"] += values["count"]
+        row["total_millis"] += values["total_millis"]
+        row["min_millis"] = min(row["min_millis"], values["min_millis"])
+        row["max_millis"] = max(row["max_millis"], values["max_millis"])
+        row["sketch"] = merge_sketches(row["sketch"], values["sketch"])
+
+    def take(self) -> list[dict]:
+        pending, self.pending = self.pending, {}
+        return [
+            {
+                "minute": minute, "route": route,
+                "method": method, "status": status, **values,
+            }
+            for (minute, route, method, status), values in pending.items()
+        ]
+
+    def restore(self, rows: list[dict]):
+        """Rows that failed to be written are kept for the next flush."""
+        for row in rows:
+            row = dict(row)
+            key = tuple(row.pop(k) for k in ("minute", "route", "method",
+                                               "status"))
+            self.merge(key, row)
+
+    async def write(self, session: AsyncSession, rows: list[dict]):
+        stmt = insert(self.r_stats)
+        table = self.r_stats.__tablename__
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["minute", "route", "method", "status"],
+            set_={
+                "count": self.r_stats.count + stmt.excluded.count,
+                "total_millis":
+                    self.r_stats.total_millis + stmt.excluded.total_millis,
+                "min_millis": literal_column(
+                    f"least({table}.min_millis, excluded.min_millis)"
+                ),
+                "max_millis": literal_column(
+                    f"greatest({table}.max_millis, excluded.max_millis)"
+                ),
+                "sketch": literal_column(
+                    f"ARRAY(SELECT a + b FROM unnest("
+                    f"{table}.sketch, excluded.sketch) AS t(a, b))"
+                ),
+            },
+        )
+        await session.execute(stmt, rows)
+
+
+route_stats = RouteStatsAggregator()
@@ -1,3 +1,18 @@
+_busy = {
+    "description": "Service unavailable",
+    "content": {
+        "application/json": {
+            "schema": {
+                "title": "Password hashing queue is full",
+                "description": "The server is busy, try again later",
+                "example": {
+                    "description": "The server is busy, try again later"
+                }
+            },
+        }
+    },
+}
+
 swagger_create_token = {
     "401": {
         "description": "Unauthorized(RefreshToken)",
@@ -13,6 +28,22 @@ swagger_create_token = {
             }
         },
     },
+    "409": {
+        "description": "Conflict",
+        "content": {
+            "application/json": {
+                "schema": {
+                    "title": "Concurrent refresh",
+                    "description": "another request with the same "
+                                   "refresh token got the access token",
+                    "example": {
+                        "detail": "The access token was refreshed "
+                                  "by a concurrent request"
+                    }
+                },
+            }
+        },
+    },
 }
 
 swagger_register = {
@@ -32,6 +63,7 @@ swagger_register = {
             }
         },
     },
+    "503": _busy,
 }
 
 swagger_login = {
@@ -49,6 +81,7 @@ swagger_login = {
             }
         },
     },
+    "503": _busy,
 }
 
 swagger_change_password = {
@@ -103,4 +136,5 @@ swagger_change_password = {
             }
         },
     },
+    "503": _busy,
 }
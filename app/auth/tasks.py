@@ -0,0 +1,224 @@
+import asyncio
+import datetime
+import logging
+import re
+
+from sqlalchemy import delete, select, or_, text
+
+from app.auth import models
+from app.database import async_session
+from app.settings import REFRESH_TOKEN_EXPIRE_HOURS, AUTH_GC_INTERVAL, \
+    AUTH_GC_BATCH_SIZE, AUTH_GC_BATCH_PAUSE, ACTIVITY_PARTITION_DAYS, \
+    ACTIVITY_PARTITION_PREMAKE, ACTIVITY_PARTITION_INTERVAL, \
+    ACTIVITY_RETENTION_DAYS, ACTIVITY_PARTITION_DETACH
+
+logger = logging.getLogger(__name__)
+
+
+class AuthTokenCleaner:
+    """
+    Deletes authorizations that can never be used again: logged out,
+    reset by a password change or with an expired refresh_token.
+    Works by small batches with a pause between them, rows locked by
+    live requests are skipped until the next run.
+    """
+
+    a_s = async_session
+    interval: float = AUTH_GC_INTERVAL
+    batch_size: int = AUTH_GC_BATCH_SIZE
+    batch_pause: float = AUTH_GC_BATCH_PAUSE
+
+    async def purge_batch(self) -> int:
+        expired = datetime.datetime.now() - datetime.timedelta(
+            hours=REFRESH_TOKEN_EXPIRE_HOURS
+        )
+        stale = select(models.AuthToken.id).where(
+            or_(
+                models.AuthToken.is_active == False,
+                models.AuthToken.created < expired,
+            )
+        ).limit(self.batch_size).with_for_update(skip_locked=True)
+        async with self.a_s() as session:
+            result = await session.execute(
+                delete(models.AuthToken).where(models.AuthToken.id.in_(stale))
+            )
+            await session.commit()
+        return result.rowcount
+
+    async def purge(self) -> int:
+        total = 0
+        while True:
+            deleted = await self.purge_batch()
+            total += deleted
+            if deleted < self.batch_size:
+                return total
+            await asyncio.sleep(self.batch_pause)
+
+    async def run(self):
+        if not self.interval:
+            return
+        while True:
+            try:
+                deleted = await self.purge()
+                if deleted:
+                    logger.info("Deleted %s stale authorizations", deleted)
+            except Exception:
+                logger.exception("Failed to delete stale authorizations")
+            await asyncio.sleep(self.interval)
+
+
+class ActivityPartitionManager:
+    """
+    users_activity partitions are named by the first day of their period.
+    Creates the partition of the current period and `premake` next ones,
+    drops (or detaches) the partitions older than `retention_days`.
+    Dropping a partition is cheap, unlike DELETE of its rows.
+    """
+
+    a_s = async_session
+    table: str = models.UsersActivity.__tablename__
+    default: str = f"{table}_default"
+    interval: float = ACTIVITY_PARTITION_INTERVAL
+    days: int = ACTIVITY_PARTITION_DAYS
+    premake: int = ACTIVITY_PARTITION_PREMAKE
+    retention_days: int = ACTIVITY_RETENTION_DAYS
+    detach: bool = ACTIVITY_PARTITION_DETACH
+
+    @classmethod
+    def period_start(cls, day: datetime.date) -> datetime.date:
+        # weekly periods start on Monday
+        ordinal = day.toordinal()
+        return datetime.date.fromordinal(ordinal - (ordinal - 1) % cls.days)
+
+    @classmethod
+    def partition_name(cls, start: datetime.date) -> str:
+        return f"{cls.table}_{start:%Y%m%d}"
+
+    async def partitions(self, session) -> list[tuple[str, datetime.date]]:
+        result = await session.scalars(
+            text(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid "
+                "WHERE i.inhparent = CAST(:table AS regclass)"
+            ),
+            {"table": self.table},
+        )
+        partitions = []
+        for name in result:
+            match = re.fullmatch(rf"{self.table}_(\d{{8}})", name)
+            if match:
+                start = datetime.datetime.strptime(match[1], "%Y%m%d")
+                partitions.append((name, start.date()))
+        return sorted(partitions, key=lambda p: p[1])
+
+    async def create_partition(self, start: datetime.date) -> bool:
+        """
+        Creates the partition of the period in its own transaction.
+        Rows of the period already in the default partition (written
+        while the partition was missing) are moved into it: PostgreSQL
+        does not create a partition over rows of the default one.
+        """
+        name = self.partition_name(start)
+        end = start + datetime.timedelta(days=self.days)
+        bounds = f"FOR VALUES FROM ('{start}') TO ('{end}')"
+        exists = text("SELECT to_regclass(:name)")
+        async with self.a_s() as session:
+            if await session.scalar(exists, {"name": name}):
+                return False
+            # No new rows of the period get into the default meanwhile.
+            # The parent is locked first, in the order of an INSERT:
+            # locking the default first deadlocks with the inserts.
+            await session.execute(text(
+                f"LOCK TABLE {self.table} IN SHARE ROW EXCLUSIVE MODE"
+            ))
+            # created by another worker while this one waited
+            if await session.scalar(exists, {"name": name}):
+                return False
+            period = f"created >= '{start}' AND created < '{end}'"
+            stray = await session.scalar(text(
+                f"SELECT count(*) FROM {self.default} WHERE {period}"
+            ))
+            if not stray:
+                await session.execute(text(
+                    f"CREATE TABLE {name} PARTITION OF {self.table} {bounds}"
+                ))
+            else:
+                await session.execute(text(
+                    f"ALTER TABLE {self.table} DETACH PARTITION {self.default}"
+                ))
+                await session.execute(text(
+                    f"CREATE TABLE {name} PARTITION OF {self.table} {bounds}"
+                ))
+                await session.execute(text(
+                    f"INSERT INTO {name} "
+                    f"SELECT * FROM {self.default} WHERE {period}"
+                ))
+                await session.execute(text(
+                    f"DELETE FROM {self.default} WHERE {period}"
+                ))
+                await session.execute(text(
+                    f"ALTER TABLE {self.table} "
+                    f"ATTACH PARTITION {self.default} DEFAULT"
+                ))
+                logger.warning(
+                    "Moved %s rows from %s to the new partition %s",
+                    stray, self.default, name,
+                )
+            await session.commit()
+        return True
+
+    async def create_partitions(self):
+        """
+        The current period and `premake` next ones. A failed period does
+        not roll back the others and is retried on the next run.
+        """
+        start = self.period_start(datetime.date.today())
+        failed = None
+        for _ in range(self.premake + 1):
+            try:
+                await self.create_partition(start)
+            except Exception as e:
+                logger.exception(
+                    "Failed to create partition %s",
+                    self.partition_name(start),
+                )
+                failed = failed or e
+            start += datetime.timedelta(days=self.days)
+        if failed:
+            raise failed
+
+    async def expire_partitions(self) -> list[str]:
+        if not self.retention_days:
+            return []
+        cutoff = datetime.date.today() - datetime.timedelta(
+            days=self.retention_days
+        )
+        expired = []
+        async with self.a_s() as session:
+            for name, start in await self.partitions(session):
+                if start + datetime.timedelta(days=self.days) > cutoff:
+                    break
+                if self.detach:
+                    await session.execute(text(
+                        f"ALTER TABLE {self.table} DETACH PARTITION {name}"
+                    ))
+                else:
+                    await session.execute(text(f"DROP TABLE {name}"))
+                expired.append(name)
+            await session.commit()
+        return expired
+
+    async def run(self):
+        if not self.interval:
+            return
+        while True:
+            try:
+                await self.create_partitions()
+                expired = await self.expire_partitions()
+                if expired:
+                    logger.info(
+                        "Expired activity partitions: %s", ", ".join(expired)
+                    )
+            except Exception:
+                logger.exception("Failed to maintain activity partitions")
+            await asyncio.sleep(self.interval)
@@ -1,20 +1,53 @@
+from typing import AsyncGenerator
+
+from starlette.requests import HTTPConnection
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 from sqlalchemy.ext.asyncio import create_async_engine
 from sqlalchemy.orm import DeclarativeBase
 
 from .settings import SQLALCHEMY_DATABASE_URL
+from .timing import instrument_engine
 
 
 engine = create_async_engine(SQLALCHEMY_DATABASE_URL, echo=False)
+instrument_engine(engine)
 async_session = async_sessionmaker(
     engine, class_=AsyncSession, expire_on_commit=False
 )
 
 
+class RequestSession:
+    """
+    One session per request, shared by the authentication and the
+    handler, so a request holds at most one pooled connection.
+    The session is created on first use and closed when the route ends.
+    """
+
+    a_s = async_session
+    scope_key = "db_session"
+
+    @classmethod
+    def get(cls, request: HTTPConnection) -> AsyncSession:
+        session = request.scope.get(cls.scope_key)
+        if session is None:
+            session = request.scope[cls.scope_key] = cls.a_s()
+        return session
+
+    @classmethod
+    async def close(cls, request: HTTPConnection):
+        session = request.scope.pop(cls.scope_key, None)
+        if session is not None:
+            await session.close()
+
+
 # Dependency
-async def get_session() -> AsyncSession:
-    async with async_session() as session:
-        yield session
+async def get_session(
+        request: HTTPConnection
+) -> AsyncGenerator[AsyncSession, None]:
+    try:
+        yield RequestSession.get(request)
+    finally:
+        await RequestSession.close(request)
 
 
 class Base(DeclarativeBase):
@@ -0,0 +1,42 @@
+from app.auth.cache import token_cache, epoch_cache
+from app.auth.log_writer import activity_log_writer
+from app.database import engine
+from app.posts.cache import count_cache
+from app.metrics.registry import metrics
+
+
+@metrics.collector
+def database_pool():
+    pool = engine.sync_engine.pool
+    yield "db_pool_size", "gauge", {}, pool.size()
+    yield "db_pool_checked_out", "gauge", {}, pool.checkedout()
+    yield "db_pool_checked_in", "gauge", {}, pool.checkedin()
+    yield "db_pool_overflow", "gauge", {}, pool.overflow()
+
+
+@metrics.collector
+def auth_caches():
+    for name, cache in (("token", token_cache), ("epoch", epoch_cache)):
+        stats = cache.stats()
+        labels = {"cache": name}
+        yield "auth_cache_size", "gauge", labels, stats["size"]
+        yield "auth_cache_hits_total", "counter", labels, stats["hits"]
+        yield "auth_cache_misses_total", "counter", labels, stats["misses"]
+        yield "auth_cache_evictions_total", "counter", labels, \
+            stats["evictions"]
+
+
+@metrics.collector
+def activity_log():
+    writer = activity_log_writer
+    yield "activity_log_queue_size", "gauge", {}, writer.queue.qsize()
+    yield "activity_log_written_total", "counter", {}, writer.written
+    yield "activity_log_dropped_total", "counter", {}, writer.dropped
+
+
+@metrics.collector
+def posts_count_cache():
+    stats = count_cache.stats()
+    yield "posts_count_cache_size", "gauge", {}, stats["size"]
+    yield "posts_count_cache_hits_total", "counter", {}, stats["hits"]
+    yield "posts_count_cache_misses_total", "counter", {}, stats["misses"]
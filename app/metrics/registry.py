@@ -0,0 +1,181 @@
+import bisect
+import json
+import os
+import time
+from pathlib import Path
+from typing import Callable, Iterable
+
+# seconds, as Prometheus expects
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"') \
+        .replace("\n", "\\n")
+
+
+def _labels(key: tuple, **extra) -> str:
+    pairs = [*key, *extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+class MetricsRegistry:
+    """
+    Counters and fixed-bucket histograms of this process, and gauges
+    read from collectors on every dump.
+    In multi-worker mode every worker dumps its metrics to a JSON file
+    of a shared directory and /metrics sums the files of all workers.
+    """
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.help: dict[str, str] = {}
+        self.counters: dict[str, dict[tuple, float]] = {}
+        # per-bucket counts, then sum and count
+        self.histograms: dict[str, dict[tuple, list[float]]] = {}
+        self.collectors: list[Callable[[], Iterable[tuple]]] = []
+
+    def describe(self, name: str, help_text: str):
+        self.help[name] = help_text
+
+    def inc(self, name: str, labels: dict, value: float = 1):
+        series = self.counters.setdefault(name, {})
+        key = _key(labels)
+        series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, labels: dict, value: float):
+        series = self.histograms.setdefault(name, {})
+        key = _key(labels)
+        if key not in series:
+            series[key] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+        values = series[key]
+        values[bisect.bisect_left(self.buckets, value)] += 1
+        values[-2] += value
+        values[-1] += 1
+
+    def collector(self, func: Callable[[], Iterable[tuple]]):
+        """
+        Registers `func`, which yields (name, kind, labels, value),
+        kind is "counter" or "gauge".
+        """
+        self.collectors.append(func)
+        return func
+
+    def dump(self) -> dict:
+        collected = {"counter": {}, "gauge": {}}
+        for collector in self.collectors:
+            for name, kind, labels, value in collector():
+                collected[kind].setdefault(name, {})[_key(labels)] = value
+        counters = {
+            name: dict(series) for name, series in self.counters.items()
+        }
+        for name, series in collected["counter"].items():
+            counters.setdefault(name, {}).update(series)
+        return {
+            "pid": os.getpid(),
+            "time": time.time(),
+            "counters": self._pairs(counters),
+            "gauges": self._pairs(collected["gauge"]),
+            "histograms": self._pairs(self.histograms),
+        }
+
+    @staticmethod
+    def _pairs(metrics: dict) -> dict:
+        return {
+            name: [[list(map(list, key)), value]
+                   for key, value in series.items()]
+            for name, series in metrics.items()
+        }
+
+    def write_dump(self, directory: str):
+        path = Path(directory)
+        path.mkdir(parents=True, exist_ok=True)
+        target = path / f"metrics-{os.getpid()}.json"
+        temporary = target.with_suffix(".tmp")
+        temporary.write_text(json.dumps(self.dump()))
+        os.replace(temporary, target)
+
+    @staticmethod
+    def read_dumps(directory: str) -> list[dict]:
+        dumps = []
+        for path in Path(directory).glob("metrics-*.json"):
+            try:
+                dumps.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                continue
+        return dumps
+
+    def render(self, dumps: list[dict] | None = None,
+               stale_after: float | None = None) -> str:
+        """
+        Prometheus text format of `dumps` summed, this process only
+        by default. Counters of exited workers are kept, so that the sums
+        never go down, gauges are taken only from dumps newer than
+        `stale_after` seconds.
+        """
+        if dumps is None:
+            dumps = [self.dump()]
+        now = time.time()
+        merged = {"counters": {}, "gauges": {}, "histograms": {}}
+        for dump in dumps:
+            for kind, metrics in merged.items():
+                if kind == "gauges" and stale_after is not None and \
+                        now - dump["time"] > stale_after:
+                    continue
+                for name, pairs in dump[kind].items():
+                    series = metrics.setdefault(name, {})
+                    for key, value in pairs:
+                        key = tuple(map(tuple, key))
+                        if kind == "histograms":
+                            total = series.get(key) or [0] * len(value)
+                            series[key] = [a + b for a, b in zip(total, value)]
+                        else:
+                            series[key] = series.get(key, 0) + value
+
+        lines = []
+        for kind, prometheus_type in (
+                ("counters", "counter"), ("gauges", "gauge")
+        ):
+            for name, series in sorted(merged[kind].items()):
+                self._header(lines, name, prometheus_type)
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_labels(key)} {value}")
+        for name, series in sorted(merged["histograms"].items()):
+            self._header(lines, name, "histogram")
+            for key, values in sorted(series.items()):
+                cumulative = 0
+                for bound, count in zip(
+                        (*map(str, self.buckets), "+Inf"), values
+                ):
+                    cumulative += count
+                    lines.append(
+                        f"{name}_bucket{_labels(key, le=bound)} {cumulative}"
+                    )
+                lines.append(f"{name}_sum{_labels(key)} {values[-2]}")
+                lines.append(f"{name}_count{_labels(key)} {values[-1]}")
+        return "\n".join(lines) + "\n"
+
+    def _header(self, lines: list, name: str, prometheus_type: str):
+        if name in self.help:
+            lines.append(f"# HELP {name} {self.help[name]}")
+        lines.append(f"# TYPE {name} {prometheus_type}")
+
+
+metrics = MetricsRegistry()
+metrics.describe("http_requests_total", "Requests by route template")
+metrics.describe(
+    "http_request_duration_seconds", "Request latency by route template"
+)
+
+
+def observe_request(route: str, method: str, status: int | None,
+                    seconds: float):
+    labels = {"route": route, "method": method, "status": status or ""}
+    metrics.inc("http_requests_total", labels)
+    metrics.observe("http_request_duration_seconds", labels, seconds)
@@ -0,0 +1,39 @@
+import asyncio
+
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from app.metrics import collectors  # noqa: F401 registers the collectors
+from app.metrics.registry import metrics
+from app.settings import METRICS_DIR, METRICS_DUMP_INTERVAL
+
+router_metrics = APIRouter(tags=["metrics"])
+
+
+@router_metrics.get(
+    "/metrics",
+    response_class=PlainTextResponse,
+    include_in_schema=False,
+)
+async def get_metrics():
+    """Prometheus text format, summed over all workers with METRICS_DIR."""
+    if not METRICS_DIR:
+        content = metrics.render()
+    else:
+        metrics.write_dump(METRICS_DIR)
+        content = metrics.render(
+            metrics.read_dumps(METRICS_DIR),
+            stale_after=METRICS_DUMP_INTERVAL * 2,
+        )
+    return PlainTextResponse(
+        content, media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
+async def dump_metrics():
+    """Keeps the dump of this worker in METRICS_DIR fresh."""
+    if not METRICS_DIR:
+        return
+    while True:
+        metrics.write_dump(METRICS_DIR)
+        await asyncio.sleep(METRICS_DUMP_INTERVAL)
@@ -0,0 +1,41 @@
+import base64
+import datetime
+import json
+from typing import Any
+
+from fastapi import HTTPException, status
+
+
+invalid_cursor_exception = HTTPException(
+    status_code=status.HTTP_400_BAD_REQUEST,
+    detail="Invalid cursor",
+)
+
+
+def encode_cursor(*values: Any) -> str:
+    """
+    Opaque cursor of keyset pagination: the sort key of the last row
+    of the page, the next page starts after it.
+    """
+    data = [
+        value.isoformat() if isinstance(value, datetime.datetime) else value
+        for value in values
+    ]
+    return base64.urlsafe_b64encode(
+        json.dumps(data, separators=(",", ":")).encode()
+    ).decode()
+
+
+def decode_cursor(cursor: str, *types: type) -> tuple:
+    """Values of encode_cursor, converted to `types`."""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if not isinstance(data, list) or len(data) != len(types):
+            raise ValueError(cursor)
+        return tuple(
+            datetime.datetime.fromisoformat(value)
+            if value_type is datetime.datetime else value_type(value)
+            for value, value_type in zip(data, types)
+        )
+    except (ValueError, TypeError):
+        raise invalid_cursor_exception
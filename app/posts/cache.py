@@ -0,0 +1,9 @@
+from app.auth.cache import TTLCache
+from app.settings import POSTS_COUNT_CACHE_SIZE, POSTS_COUNT_CACHE_TTL
+
+
+# FilterPosts.count_key -> total of GET /posts/, tagged by the user id
+# of the my_like counts
+count_cache = TTLCache(
+    maxsize=POSTS_COUNT_CACHE_SIZE, ttl=POSTS_COUNT_CACHE_TTL
+)
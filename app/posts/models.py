@@ -1,8 +1,7 @@
 import datetime
 
-from sqlalchemy import ForeignKey, UniqueConstraint, DateTime, select
-from sqlalchemy.orm import Mapped, mapped_column, relationship, column_property
-from sqlalchemy.sql.functions import func
+from sqlalchemy import ForeignKey, UniqueConstraint, Index
+from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from app.auth.models import User
 from app.database import Base
@@ -47,15 +46,22 @@ class Posts(Base):
     )
     is_deleted: Mapped[bool] = mapped_column(default=False)
     author: Mapped["User"] = relationship(lazy="joined")
-    like = column_property(
-        select(func.count(Likes.id))
-        .where(Likes.like == True, Likes.post_id == id)
-        .correlate_except(Likes)
-        .scalar_subquery()
-    )
-    dislike = column_property(
-        select(func.count(Likes.id))
-        .where(Likes.like == False, Likes.post_id == id)
-        .correlate_except(Likes)
-        .scalar_subquery()
+    # Counts of Likes rows, kept by setting_likes_dislikes,
+    # recomputed by `python -m app.posts.reconcile`
+    like: Mapped[int] = mapped_column(
+        "likes_count", default=0, server_default="0",
+    )
+    dislike: Mapped[int] = mapped_column(
+        "dislikes_count", default=0, server_default="0",
+    )
+    # keys of the keyset pagination of GET /posts/, see FilterPosts
+    __table_args__ = (
+        Index(
+            "ix_posts_created_id", "created", "id",
+            postgresql_where=is_deleted == False,
+        ),
+        Index(
+            "ix_posts_author_created_id", "author_id", "created", "id",
+            postgresql_where=is_deleted == False,
+        ),
     )
@@ -0,0 +1,72 @@
+import asyncio
+import logging
+
+from sqlalchemy import select, update, func, or_
+from sqlalchemy.orm import aliased
+
+from app.database import async_session
+from app.posts import models
+
+logger = logging.getLogger(__name__)
+
+
+class LikesReconciler:
+    """
+    Recomputes Posts.like and Posts.dislike from the likes table by
+    ranges of `batch_size` post ids, one short transaction per range.
+    Only the posts whose counters drifted are updated.
+    Run: python -m app.posts.reconcile
+    """
+
+    a_s = async_session
+    batch_size: int = 1000
+
+    def counts(self, first_id: int, last_id: int):
+        post = aliased(models.Posts)
+        likes = models.Likes
+        return select(
+            post.id,
+            func.count(likes.id).filter(likes.like == True).label("like"),
+            func.count(likes.id).filter(likes.like == False).label("dislike"),
+        ).outerjoin(
+            likes, likes.post_id == post.id
+        ).where(
+            post.id.between(first_id, last_id)
+        ).group_by(post.id).subquery()
+
+    async def reconcile_batch(self, first_id: int, last_id: int) -> int:
+        counts = self.counts(first_id, last_id)
+        async with self.a_s() as session:
+            result = await session.execute(
+                update(models.Posts).where(
+                    models.Posts.id == counts.c.id,
+                    or_(
+                        models.Posts.like != counts.c.like,
+                        models.Posts.dislike != counts.c.dislike,
+                    ),
+                ).values({
+                    models.Posts.like: counts.c.like,
+                    models.Posts.dislike: counts.c.dislike,
+                }).execution_options(synchronize_session=False)
+            )
+            await session.commit()
+        return result.rowcount
+
+    async def reconcile(self) -> int:
+        async with self.a_s() as session:
+            last_id = await session.scalar(select(func.max(models.Posts.id)))
+        fixed = 0
+        for first_id in range(1, (last_id or 0) + 1, self.batch_size):
+            fixed += await self.reconcile_batch(
+                first_id, first_id + self.batch_size - 1
+            )
+        return fixed
+
+
+async def main():
+    fixed = await LikesReconciler().reconcile()
+    logger.warning("Posts with fixed like counters: %s", fixed)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -8,9 +8,10 @@ from app.auth.router_class import RouteAuth, RouteWithOutAuth
 from app.database import get_session
 from app.posts import models
 from app.posts import schemas
+from app.posts.cache import count_cache
 from .swagger_posts import *
 from app.posts.utils import get_post_in_db, setting_likes_dislikes, \
-    get_post_in_db_and_like
+    get_post_in_db_and_like, select_page
 from app.posts.schemas import FilterPosts, LikeDislike
 
 router_posts = APIRouter(
@@ -41,6 +42,10 @@ async def get_posts(
     Filter: author, date_from, date_to, my_like \n
     Sorting: from_new_to_old \n
     Skip and Limit \n
+    Infinite scroll: pass next_cursor of the page as cursor to get
+    the next one, next_cursor is null on the last page \n
+    Total: include_total=false skips the count, estimate_total=true
+    without filters returns the estimate of the database \n
     For authorized users:
     my_like: True=like, False=dislike, all=like and dislike \n
 
@@ -54,12 +59,7 @@ async def get_posts(
     "all" filter where their likes or dislikes stand.\n
 
     """
-    count = await session.scalars(q.select_posts(
-        request=request, count=True)
-    )
-    posts = await session.execute(
-        q.select_posts(request=request)
-    )
+    posts, total, total_estimated = await select_page(q, request, session)
     result = [
         {
             **p._mapping.get("Posts", {}).__dict__,
@@ -67,7 +67,11 @@ async def get_posts(
         } for p in posts
     ]
 
-    return {**q.model_dump(), "posts": result, "total": count.one()}
+    return {
+        **q.model_dump(), "posts": result,
+        "total": total, "total_estimated": total_estimated,
+        "next_cursor": q.cursor_after([p.Posts for p in posts]),
+    }
 
 
 @router_posts.post(
@@ -87,6 +91,7 @@ async def create_post(
     )
     session.add(post)
     await session.commit()
+    count_cache.clear()
     await session.refresh(post)
     return post
 
@@ -173,5 +178,6 @@ async def delete_post(
     post.is_deleted = True
     post.update_date = datetime.datetime.now()
     await session.commit()
+    count_cache.clear()
 
     return f"Post with id={post_id} successfully deleted"
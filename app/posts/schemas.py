@@ -3,9 +3,11 @@ from typing import List, Optional, Literal, Any
 
 from fastapi import HTTPException, status, Request
 from pydantic import BaseModel, Field, model_validator, field_validator
-from sqlalchemy import select, Select, func
+from sqlalchemy import select, Select, func, tuple_
 from sqlalchemy.orm import aliased
 
+from app.pagination import encode_cursor, decode_cursor, \
+    invalid_cursor_exception
 from app.posts import models
 from app.users.models import User
 
@@ -52,6 +54,17 @@ class FilterPosts(BaseModel):
     date_from: Optional[datetime.datetime] = None
     date_to: Optional[datetime.datetime] = None
     my_like: Optional[bool] | Literal["all"] = Field(default=None)
+    cursor: Optional[str] = Field(
+        default=None,
+        description="next_cursor of the previous page, skip is ignored",
+    )
+    include_total: bool = Field(
+        default=True, description="False - total is not counted, null"
+    )
+    estimate_total: bool = Field(
+        default=False,
+        description="Without filters: total is the estimate of the planner",
+    )
 
     @field_validator('limit', mode="before")
     def check_limit(cls, v: int) -> int:
@@ -62,14 +75,18 @@ class FilterPosts(BaseModel):
         else:
             return v
 
-    def select_posts(self, request: Request, count=None) -> Select:
+    def select_posts(
+            self, request: Request, count=None, with_total=False
+    ) -> Select:
         """
         Passes the FilterPosts parameters to the select(model.Post)
             * my_like True=like, False=dislike, all=like and dislike
             * author, date_from, date_to in .filter(*)
             * from_new_to_old in .order_by(*)
             * limit in .limit(*)
-            * skip in .offset(*)
+            * skip in .offset(*), or cursor in .filter(*)
+        with_total adds the "total" column, the count of all the rows
+        of the filters, computed before the limit
         """
         if isinstance(request.user, User):
             user: User = request.user
@@ -98,11 +115,6 @@ class FilterPosts(BaseModel):
         elif self.date_to:
             queries.append(models.Posts.created <= self.date_to)
 
-        order_by = [
-            models.Posts.created.desc() if self.from_new_to_old
-            else models.Posts.created,
-        ]
-
         if count and my_like and self.my_like is not None:
             return select(
                 func.count(models.Posts.id)
@@ -112,37 +124,86 @@ class FilterPosts(BaseModel):
                 func.count(models.Posts.id)
             ).filter(*queries)
 
+        # id breaks the ties of created, so that pages are stable
+        key = tuple_(models.Posts.created, models.Posts.id)
+        if self.from_new_to_old:
+            order_by = [models.Posts.created.desc(), models.Posts.id.desc()]
+        else:
+            order_by = [models.Posts.created, models.Posts.id]
+        offset = self.skip
+        if self.cursor:
+            created, id_, from_new_to_old = decode_cursor(
+                self.cursor, datetime.datetime, int, bool
+            )
+            if from_new_to_old != self.from_new_to_old:
+                raise invalid_cursor_exception
+            queries.append(
+                key < (created, id_) if self.from_new_to_old
+                else key > (created, id_)
+            )
+            offset = None
+
         if not my_like:
-            return select(
+            query = select(
                 models.Posts
             ).filter(
                 *queries
-            ).order_by(*order_by).limit(self.limit).offset(self.skip)
+            )
+        elif self.my_like is not None:
+            query = select(
+                models.Posts,
+                my_like.like.label("my_like")
+            ).join(
+                my_like
+            ).filter(
+                *queries
+            )
         else:
-            if self.my_like is not None:
-                return select(
-                    models.Posts,
-                    my_like.like.label("my_like")
-                ).join(
-                    my_like
-                ).filter(
-                    *queries
-                ).order_by(*order_by).limit(self.limit).offset(self.skip)
-            else:
-                return select(
-                    models.Posts,
-                    my_like.like.label("my_like")
-                ).filter(
-                    *queries
-                ).join(
-                    models.Posts,
-                    full=True
-                ).order_by(*order_by).limit(self.limit).offset(self.skip)
+            query = select(
+                models.Posts,
+                my_like.like.label("my_like")
+            ).filter(
+                *queries
+            ).join(
+                models.Posts,
+                full=True
+            )
+        if with_total:
+            query = query.add_columns(func.count().over().label("total"))
+        return query.order_by(*order_by).limit(self.limit).offset(offset)
+
+    def my_like_user(self, request: Request) -> Optional[int]:
+        """The user whose likes filter the posts."""
+        if isinstance(request.user, User) and self.my_like is not None:
+            return request.user.id
+        return None
+
+    def count_key(self, request: Request) -> tuple:
+        """The filters the total depends on."""
+        return (
+            self.author, self.date_from, self.date_to,
+            self.my_like_user(request),
+            self.my_like if self.my_like_user(request) else None,
+        )
+
+    def has_filters(self, request: Request) -> bool:
+        return any(self.count_key(request))
+
+    def cursor_after(self, posts: list) -> Optional[str]:
+        """Cursor after the last of `posts`, None on the last page."""
+        if len(posts) < self.limit:
+            return None
+        last = posts[-1]
+        return encode_cursor(last.created, last.id, self.from_new_to_old)
 
 
 class AllPosts(FilterPosts):
-    total: int
+    total: Optional[int] = Field(description="Null without include_total")
+    total_estimated: bool = False
     posts: List[PostBase]
+    next_cursor: Optional[str] = Field(
+        default=None, description="Null on the last page"
+    )
 
 
 class LikeDislike(BaseModel):
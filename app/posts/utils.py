@@ -1,9 +1,15 @@
-from sqlalchemy import select
+from typing import Optional
+
+from sqlalchemy import select, update, text
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import Request, HTTPException, status
 from sqlalchemy.orm import aliased
 
 from app.posts import models
+from app.posts.cache import count_cache
+from app.posts.schemas import FilterPosts
+from app.settings import POSTS_WINDOW_TOTAL
 from app.users.models import User
 
 
@@ -75,6 +81,72 @@ async def get_post_in_db_and_like(
             return {**post.__dict__, "my_like": None}
 
 
+async def estimate_posts(session: AsyncSession) -> int:
+    """Rows of the not deleted posts by the planner statistics."""
+    query = select(models.Posts.id).where(models.Posts.is_deleted == False)
+    sql = query.compile(
+        dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+    )
+    plan = await session.scalar(text(f"EXPLAIN (FORMAT JSON) {sql}"))
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+async def count_posts(
+        q: FilterPosts,
+        request: Request,
+        session: AsyncSession,
+) -> tuple[Optional[int], bool]:
+    """
+    Total of the posts of the filters and whether it is an estimate.
+    Exact totals are cached in count_cache.
+    """
+    if not q.include_total:
+        return None, False
+    if q.estimate_total and not q.has_filters(request):
+        return await estimate_posts(session), True
+
+    key = q.count_key(request)
+    total = count_cache.get(key)
+    if total is None:
+        total = await session.scalar(
+            q.select_posts(request=request, count=True)
+        )
+        count_cache.set(key, total, tag=q.my_like_user(request))
+    return total, False
+
+
+async def select_page(
+        q: FilterPosts,
+        request: Request,
+        session: AsyncSession,
+) -> tuple[list, Optional[int], bool]:
+    """
+    Rows of the page, the total and whether it is an estimate.
+    A total to be counted comes with the page in one statement, unless
+    the page starts at a cursor: the window would only count the rest.
+    """
+    key = q.count_key(request)
+    if POSTS_WINDOW_TOTAL and q.include_total and not q.cursor \
+            and not (q.estimate_total and not q.has_filters(request)) \
+            and count_cache.get(key) is None:
+        posts = (await session.execute(
+            q.select_posts(request=request, with_total=True)
+        )).all()
+        if posts:
+            total = posts[0].total
+        else:
+            # past the last page the window has no rows to carry it
+            total = await session.scalar(
+                q.select_posts(request=request, count=True)
+            )
+        count_cache.set(key, total, tag=q.my_like_user(request))
+        return posts, total, False
+
+    total, total_estimated = await count_posts(q, request, session)
+    posts = (await session.execute(q.select_posts(request=request))).all()
+    return posts, total, total_estimated
+
+
 async def setting_likes_dislikes(
         post_id: int,
         data: dict,
@@ -90,11 +162,12 @@ async def setting_likes_dislikes(
         )
     )
 
+    # locked, so that parallel requests of the user count the change once
     like_info = await session.scalars(
         select(models.Likes).where(
             models.Likes.user_id == request.user.id,
             models.Likes.post_id == post_id,
-        )
+        ).with_for_update()
     )
 
     post = post.one_or_none()
@@ -117,22 +190,36 @@ async def setting_likes_dislikes(
 
         case {"like": "on", "current_status": None} | \
              {"like": "on", "current_status": False}:
-            like_info.like = True
+            like_info.like = new_status = True
             text_result = "The reaction is like delivered"
 
         case {"like": "off", "current_status": True} | \
              {"dislike": "off", "current_status": False}:
             await session.delete(like_info)
+            new_status = None
             text_result = "Reaction removed"
 
         case {"dislike": "on", "current_status": True} | \
              {"dislike": "on", "current_status": None}:
-            like_info.like = False
+            like_info.like = new_status = False
             text_result = "The reaction is dislike delivered"
 
         case _:
             await session.rollback()
             return text_result
 
+    # the counters change in the same transaction as the reaction
+    old_status = data["current_status"]
+    await session.execute(
+        update(models.Posts).where(
+            models.Posts.id == post_id,
+        ).values({
+            models.Posts.like: models.Posts.like
+            + int(new_status is True) - int(old_status is True),
+            models.Posts.dislike: models.Posts.dislike
+            + int(new_status is False) - int(old_status is False),
+        })
+    )
     await session.commit()
+    count_cache.invalidate_tag(request.user.id)
     return text_result
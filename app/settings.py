@@ -9,6 +9,84 @@ ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 REFRESH_TOKEN_EXPIRE_HOURS = 24*3
 CONCURRENT_CONNECTIONS = 0
+# Resolved tokens are kept in memory of each worker.
+# A revocation made by another worker is seen after AUTH_CACHE_TTL seconds.
+AUTH_CACHE_SIZE = 10000
+AUTH_CACHE_TTL = 30
+# True - access tokens are checked by the signature and the user token epoch
+# kept in memory, the auth table is not read on requests
+STATELESS_ACCESS_TOKENS = False
+AUTH_EPOCH_CACHE_SIZE = 10000
+AUTH_EPOCH_TTL = 30
+# Inactive and expired authorizations are deleted every AUTH_GC_INTERVAL
+# seconds by batches of AUTH_GC_BATCH_SIZE rows, 0 - never deleted
+AUTH_GC_INTERVAL = 60 * 10
+AUTH_GC_BATCH_SIZE = 1000
+AUTH_GC_BATCH_PAUSE = 0.5
+# users_activity is partitioned by created, ACTIVITY_PARTITION_DAYS days
+# per partition (changing it, keep the old partitions in mind).
+# Every ACTIVITY_PARTITION_INTERVAL seconds ACTIVITY_PARTITION_PREMAKE
+# partitions are created ahead and the ones older than
+# ACTIVITY_RETENTION_DAYS are dropped, or only detached with
+# ACTIVITY_PARTITION_DETACH. ACTIVITY_RETENTION_DAYS = 0 - kept forever
+ACTIVITY_PARTITION_DAYS = 1
+ACTIVITY_PARTITION_PREMAKE = 3
+ACTIVITY_PARTITION_INTERVAL = 60 * 60
+ACTIVITY_RETENTION_DAYS = 30
+ACTIVITY_PARTITION_DETACH = False
+# Request logs are written in the background by multi-row INSERTs
+ACTIVITY_LOG_QUEUE_SIZE = 10000
+ACTIVITY_LOG_BATCH_SIZE = 500
+ACTIVITY_LOG_FLUSH_INTERVAL = 1.0
+# "db" - the records are inserted into users_activity, "spool" - appended
+# to JSONL segments in ACTIVITY_LOG_SPOOL_DIR, closed by size or age and
+# loaded by COPY every ACTIVITY_LOG_SPOOL_LOAD_INTERVAL seconds, by each
+# worker if ACTIVITY_LOG_SPOOL_LOADER or by `python -m app.auth.spool`.
+# A segment claimed by a loader that died is loaded again after
+# ACTIVITY_LOG_SPOOL_STALE_SECONDS
+ACTIVITY_LOG_SINK = "db"
+ACTIVITY_LOG_SPOOL_DIR = "spool"
+ACTIVITY_LOG_SPOOL_SEGMENT_SIZE = 16 * 1024 * 1024
+ACTIVITY_LOG_SPOOL_SEGMENT_SECONDS = 60
+ACTIVITY_LOG_SPOOL_LOAD_INTERVAL = 5
+ACTIVITY_LOG_SPOOL_LOADER = True
+ACTIVITY_LOG_SPOOL_STALE_SECONDS = 600
+# Defaults of the logging policy of the route classes (BaseUserLogs):
+# the share of logged successful requests, the requests slower than
+# ACTIVITY_LOG_SLOW_MILLIS and the errors are always logged
+ACTIVITY_LOG_SAMPLE_RATE = 1.0
+ACTIVITY_LOG_SLOW_MILLIS = None
+ACTIVITY_LOG_BODY = True
+# At most so many bytes of the request body are kept in the log
+ACTIVITY_LOG_BODY_LIMIT = 4096
+# Adds the Server-Timing header with the stages of the request
+SERVER_TIMING = False
+# GET /metrics in Prometheus format. With several workers set
+# METRICS_DIR to a directory shared by them, every worker writes its
+# metrics there every METRICS_DUMP_INTERVAL seconds
+METRICS_DIR = None
+METRICS_DUMP_INTERVAL = 15
+# Totals of GET /posts/ are kept in memory of each worker by the filters.
+# A post created or deleted through another worker is counted after
+# POSTS_COUNT_CACHE_TTL seconds, 0 - counted on every request
+POSTS_COUNT_CACHE_SIZE = 1000
+POSTS_COUNT_CACHE_TTL = 10
+# True - a total missing from the cache is read with the page,
+# by count(*) OVER () in the same statement. One round trip less, but
+# all the matching posts are read and sorted before the limit instead
+# of the first page of the (created, id) index, measure it first
+POSTS_WINDOW_TOTAL = False
+# "thread" or "process"
+PASSWORD_HASH_EXECUTOR = "thread"
+PASSWORD_HASH_WORKERS = 4
+PASSWORD_HASH_QUEUE = 64
+# New passwords are hashed by the first scheme, the others are still
+# accepted and rehashed on the next login. "argon2" is argon2id.
+PASSWORD_HASH_SCHEMES = ["bcrypt"]
+BCRYPT_ROUNDS = 12
+ARGON2_TIME_COST = 2
+ARGON2_MEMORY_COST = 19456  # KiB
+ARGON2_PARALLELISM = 1
 
 DB_USER_TEST = os.getenv("DB_USER_TEST")
 DB_PASS_TEST = os.getenv("DB_PASS_TEST")
@@ -0,0 +1,89 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+
+class Timings:
+    """
+    Milliseconds spent in every stage of one request,
+    measured with the monotonic clock.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: dict[str, float] = {}
+
+    def add(self, stage: str, millis: float):
+        self.stages[stage] = self.stages.get(stage, 0.0) + millis
+
+    def get(self, stage: str) -> Optional[float]:
+        return self.stages.get(stage)
+
+    @property
+    def total(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    @contextmanager
+    def measure(self, stage: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, (time.perf_counter() - started) * 1000)
+
+    def header(self) -> str:
+        """Value of the Server-Timing response header."""
+        stages = {**self.stages, "total": self.total}
+        return ", ".join(
+            f"{stage};dur={millis:.1f}" for stage, millis in stages.items()
+        )
+
+
+_timings: ContextVar[Optional[Timings]] = ContextVar("timings", default=None)
+
+
+@contextmanager
+def collect():
+    """Timings of the request handled inside the block."""
+    timings = Timings()
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
+
+
+def current() -> Optional[Timings]:
+    return _timings.get()
+
+
+@contextmanager
+def measure(stage: str):
+    """Adds to `stage` of the current request, if there is one."""
+    timings = current()
+    if timings is None:
+        yield
+        return
+    with timings.measure(stage):
+        yield
+
+
+def instrument_engine(engine: AsyncEngine):
+    """Every statement of the engine is added to the "db" stage."""
+
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters,
+                              context, executemany):
+        conn.info["timing_started"] = time.perf_counter()
+
+    @event.listens_for(engine.sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters,
+                             context, executemany):
+        started = conn.info.pop("timing_started", None)
+        timings = current()
+        if timings is not None and started is not None:
+            timings.add("db", (time.perf_counter() - started) * 1000)
@@ -1,3 +1,4 @@
+from sqlalchemy import false
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.database import Base
@@ -12,3 +13,10 @@ class User(Base):
     email: Mapped[str] = mapped_column(unique=True, index=True)
     hashed_password: Mapped[str] = mapped_column()
     is_active: Mapped[bool] = mapped_column(default=True)
+    # Access to /admin, granted only in the database
+    is_superuser: Mapped[bool] = mapped_column(
+        default=False, server_default=false(),
+    )
+    # Bumped on logout, password change and deletion,
+    # access tokens of an older epoch are rejected in stateless mode
+    token_epoch: Mapped[int] = mapped_column(default=0, server_default="0")
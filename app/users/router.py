@@ -4,6 +4,7 @@ from fastapi import APIRouter, Depends, status, Request
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.auth.cache import forget_user
 from app.auth.router_class import RouteAuth
 from app.database import get_session
 from app.users import models
@@ -35,11 +36,12 @@ async def change_name_user(
         form_data: UserName,
         session: Annotated[AsyncSession, Depends(get_session)],
 ):
-    user = await session.get(
-        models.User, request.user.id,
-    )
+    # the user loaded by the authentication, no second SELECT
+    user = request.user
+    session.add(user)
     user.username = form_data.username
     await session.commit()
+    forget_user(user.id)
     return user
 
 
@@ -52,9 +54,10 @@ async def delete_me(
         request: Request,
         session: Annotated[AsyncSession, Depends(get_session)],
 ):
-    user = await session.get(
-        models.User, request.user.id,
-    )
+    user = request.user
+    session.add(user)
     user.is_active = False
+    user.token_epoch = models.User.token_epoch + 1
     await session.commit()
+    forget_user(user.id)
     return user
@@ -28,3 +28,4 @@ class User(UserBase):
 class UserToken(UserBase):
     id: int
     username: str
+    token_epoch: int = 0
@@ -0,0 +1,48 @@
+"""
+Hashes per second of every password hashing configuration.
+
+    python -m benchmarks.bench_password_hash [seconds per configuration]
+"""
+import sys
+import time
+
+from app.auth.hashing import make_context
+
+
+CONFIGURATIONS = {
+    "bcrypt rounds=10": dict(schemes=["bcrypt"], bcrypt_rounds=10),
+    "bcrypt rounds=12": dict(schemes=["bcrypt"], bcrypt_rounds=12),
+    "bcrypt rounds=14": dict(schemes=["bcrypt"], bcrypt_rounds=14),
+    "argon2id t=1 m=19MiB p=1": dict(
+        schemes=["argon2"], argon2_time_cost=1,
+        argon2_memory_cost=19456, argon2_parallelism=1,
+    ),
+    "argon2id t=2 m=19MiB p=1": dict(
+        schemes=["argon2"], argon2_time_cost=2,
+        argon2_memory_cost=19456, argon2_parallelism=1,
+    ),
+    "argon2id t=3 m=64MiB p=4": dict(
+        schemes=["argon2"], argon2_time_cost=3,
+        argon2_memory_cost=65536, argon2_parallelism=4,
+    ),
+}
+
+
+def bench(context, seconds: float) -> float:
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        context.hash("benchmark-password")
+        count += 1
+    return count / (time.perf_counter() - start)
+
+
+def main(seconds: float = 2.0):
+    print(f"{'configuration':<28}{'hashes/sec':>12}{'ms/hash':>10}")
+    for name, params in CONFIGURATIONS.items():
+        rate = bench(make_context(**params), seconds)
+        print(f"{name:<28}{rate:>12.1f}{1000 / rate:>10.1f}")
+
+
+if __name__ == "__main__":
+    main(*map(float, sys.argv[1:2]))
@@ -0,0 +1,112 @@
+"""
+Latency of a page of GET /posts/ with its total: the count and the page
+one after another on one connection, both at once on two connections,
+and one statement with count(*) OVER ().
+Needs the database from app/settings.py with the migrations applied,
+a temporary user with the posts is created and deleted.
+
+    python -m benchmarks.bench_posts_feed [iterations] [posts]
+"""
+import asyncio
+import statistics
+import sys
+import time
+import uuid
+from types import SimpleNamespace
+
+from sqlalchemy import delete, insert
+
+from app.auth import models
+from app.database import async_session, engine
+from app.posts.models import Posts
+from app.posts.schemas import FilterPosts
+
+# unauthenticated: no my_like join
+REQUEST = SimpleNamespace(user=None)
+
+
+async def sequential(q: FilterPosts):
+    async with async_session() as session:
+        await session.scalar(q.select_posts(request=REQUEST, count=True))
+        (await session.execute(q.select_posts(request=REQUEST))).all()
+
+
+async def concurrent(q: FilterPosts):
+    async def count():
+        async with async_session() as session:
+            await session.scalar(q.select_posts(request=REQUEST, count=True))
+
+    async def page():
+        async with async_session() as session:
+            (await session.execute(q.select_posts(request=REQUEST))).all()
+
+    await asyncio.gather(count(), page())
+
+
+async def window(q: FilterPosts):
+    async with async_session() as session:
+        (await session.execute(
+            q.select_posts(request=REQUEST, with_total=True)
+        )).all()
+
+
+async def measure(func, iterations: int, *args) -> list[float]:
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await func(*args)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+async def main(iterations: int = 500, posts: int = 10000):
+    async with async_session() as session:
+        db_user = models.User(
+            username="bench",
+            email=f"bench-{uuid.uuid4().hex}@example.com",
+            hashed_password="-",
+        )
+        session.add(db_user)
+        await session.flush()
+        user_id = db_user.id
+        await session.execute(insert(Posts), [
+            {"title": f"bench {i}", "text": "-", "author_id": user_id}
+            for i in range(posts)
+        ])
+        await session.commit()
+
+    try:
+        print(f"{'query':<20}{'filter':<10}{'p50 ms':>10}{'p95 ms':>10}"
+              f"{'mean ms':>10}")
+        for filter_name, q in (
+                ("none", FilterPosts()),
+                ("author", FilterPosts(author=user_id)),
+        ):
+            for name, func in (
+                    ("count, page", sequential),
+                    ("count || page", concurrent),
+                    ("count(*) over ()", window),
+            ):
+                # warm up the pool and the prepared statements
+                await measure(func, 20, q)
+                timings = await measure(func, iterations, q)
+                p95 = statistics.quantiles(timings, n=20)[-1]
+                print(
+                    f"{name:<20}{filter_name:<10}"
+                    f"{statistics.median(timings):>10.3f}"
+                    f"{p95:>10.3f}{statistics.fmean(timings):>10.3f}"
+                )
+    finally:
+        async with async_session() as session:
+            await session.execute(
+                delete(Posts).where(Posts.author_id == user_id)
+            )
+            await session.execute(
+                delete(models.User).where(models.User.id == user_id)
+            )
+            await session.commit()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(*map(int, sys.argv[1:3])))
@@ -0,0 +1,122 @@
+"""
+Latency of the refresh_token rotation: the former path
+(SELECT user, SELECT auth, UPDATE through the ORM) against get_new_token
+(one UPDATE ... RETURNING).
+Needs the database from app/settings.py with the migrations applied,
+a temporary user is created and deleted.
+
+    python -m benchmarks.bench_refresh_token [iterations]
+"""
+import asyncio
+import datetime
+import statistics
+import sys
+import time
+import uuid
+
+from sqlalchemy import select, delete
+
+from app.auth import models
+from app.auth.schemas import create_token, get_new_token
+from app.database import async_session, engine
+from app.users.schemas import UserToken
+
+
+async def select_and_update(refresh_token: str, user: UserToken):
+    async with async_session() as session:
+        db_user = (await session.scalars(
+            select(models.User).where(
+                models.User.id == user.id,
+                models.User.username == user.username,
+                models.User.email == user.email,
+                models.User.is_active == True,
+            )
+        )).one()
+        auth = (await session.scalars(
+            select(models.AuthToken).where(
+                models.AuthToken.user_id == db_user.id,
+                models.AuthToken.refresh_token_hash ==
+                models.token_digest(refresh_token),
+                models.AuthToken.is_active == True,
+            )
+        )).one()
+        new_token = create_token(
+            user=UserToken.model_validate(db_user),
+            refresh_token=refresh_token,
+            auth_id=auth.id,
+        )
+        auth.access_token_hash = models.token_digest(new_token.access_token)
+        auth.last_update = datetime.datetime.now()
+        await session.commit()
+
+
+async def single_update(refresh_token: str, user: UserToken):
+    async with async_session() as session:
+        await get_new_token(refresh_token, session)
+
+
+async def measure(func, iterations: int, *args) -> list[float]:
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await func(*args)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+async def main(iterations: int = 500):
+    async with async_session() as session:
+        db_user = models.User(
+            username="bench",
+            email=f"bench-{uuid.uuid4().hex}@example.com",
+            hashed_password="-",
+        )
+        session.add(db_user)
+        await session.flush()
+        user = UserToken.model_validate(db_user)
+        auth_id = await session.scalar(
+            select(models.AuthToken.id_seq.next_value())
+        )
+        token = create_token(user=user, auth_id=auth_id)
+        session.add(models.AuthToken(
+            id=auth_id,
+            user_id=user.id,
+            access_token_hash=models.token_digest(token.access_token),
+            refresh_token_hash=models.token_digest(token.refresh_token),
+        ))
+        await session.commit()
+
+    try:
+        # warm up the pool and the prepared statements
+        await measure(select_and_update, 20, token.refresh_token, user)
+        await measure(single_update, 20, token.refresh_token, user)
+
+        print(f"{'path':<24}{'p50 ms':>10}{'p95 ms':>10}{'mean ms':>10}")
+        for name, func in (
+                ("select + update", select_and_update),
+                ("update ... returning", single_update),
+        ):
+            timings = await measure(
+                func, iterations, token.refresh_token, user
+            )
+            p95 = statistics.quantiles(timings, n=20)[-1]
+            print(
+                f"{name:<24}{statistics.median(timings):>10.3f}"
+                f"{p95:>10.3f}{statistics.fmean(timings):>10.3f}"
+            )
+    finally:
+        async with async_session() as session:
+            await session.execute(
+                delete(models.AuthToken).where(
+                    models.AuthToken.user_id == user.id
+                )
+            )
+            await session.execute(
+                delete(models.User).where(models.User.id == user.id)
+            )
+            await session.commit()
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(*map(int, sys.argv[1:2])))
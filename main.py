@@ -1,18 +1,59 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from starlette.middleware import Middleware
-from starlette.middleware.authentication import AuthenticationMiddleware
 
-from app.auth.auth import BasicAuthBackend
+from app.admin.router import router_admin
+from app.auth.activity import ActivityLogMiddleware
+from app.auth.auth import BasicAuthBackend, LazyAuthenticationMiddleware
+from app.auth.hashing import password_hasher
+from app.auth.log_writer import activity_log_writer
 from app.auth.router import router_auth, router_with_out_auth
+from app.auth.spool import SpoolLoader
+from app.auth.tasks import AuthTokenCleaner, ActivityPartitionManager
+from app.metrics.router import router_metrics, dump_metrics
 from app.posts.router import router_posts, router_posts_wa
 from app.users.router import router_users
+from app.settings import ACTIVITY_LOG_SINK, ACTIVITY_LOG_SPOOL_LOADER
 
 middleware = [
-    Middleware(AuthenticationMiddleware, backend=BasicAuthBackend())
+    Middleware(ActivityLogMiddleware),
+    Middleware(LazyAuthenticationMiddleware, backend=BasicAuthBackend()),
 ]
 
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # the logs of the first requests must not land in the default partition
+    try:
+        await ActivityPartitionManager().create_partitions()
+    except Exception:
+        logging.getLogger(__name__).exception(
+            "Failed to create activity partitions"
+        )
+    tasks = [
+        asyncio.create_task(AuthTokenCleaner().run()),
+        asyncio.create_task(ActivityPartitionManager().run()),
+        asyncio.create_task(dump_metrics()),
+    ]
+    if ACTIVITY_LOG_SINK == "spool" and ACTIVITY_LOG_SPOOL_LOADER:
+        tasks.append(asyncio.create_task(SpoolLoader().run()))
+    log_writer = asyncio.create_task(activity_log_writer.run())
+    yield
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    # the queued logs are written before the exit
+    activity_log_writer.stop()
+    await log_writer
+    password_hasher.shutdown()
+
+
 app = FastAPI(
     middleware=middleware,
+    lifespan=lifespan,
     title="Webtronics_test"
 )
 
@@ -21,3 +62,5 @@ app.include_router(router_auth)
 app.include_router(router_posts)
 app.include_router(router_posts_wa)
 app.include_router(router_users)
+app.include_router(router_admin)
+app.include_router(router_metrics)
@@ -0,0 +1,131 @@
+"""initial
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17 12:00:00.000000
+
+The schema as created by Base.metadata.create_all before the first
+revision. A database created that way is brought under alembic
+with `alembic stamp 0001`.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('username', sa.String(), nullable=False),
+        sa.Column('email', sa.String(), nullable=False),
+        sa.Column('hashed_password', sa.String(), nullable=False),
+        sa.Column('is_active', sa.Boolean(), nullable=False),
+        sa.PrimaryKeyConstraint('id', name='users_pkey'),
+    )
+    op.create_index('ix_users_email', 'users', ['email'], unique=True)
+    op.create_index('ix_users_id', 'users', ['id'])
+
+    op.create_table(
+        'auth',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('access_token', sa.String(), nullable=False),
+        sa.Column('last_update', sa.DateTime(), nullable=False),
+        sa.Column('refresh_token', sa.String(), nullable=False),
+        sa.Column('is_active', sa.Boolean(), nullable=False),
+        sa.Column('created', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ['user_id'], ['users.id'], name='auth_user_id_fkey'
+        ),
+        sa.PrimaryKeyConstraint('id', name='auth_pkey'),
+        sa.UniqueConstraint('access_token', name='auth_access_token_key'),
+        sa.UniqueConstraint('refresh_token', name='auth_refresh_token_key'),
+    )
+    op.create_index('ix_auth_id', 'auth', ['id'])
+    op.create_index('ix_user_id', 'auth', ['user_id'])
+
+    op.create_table(
+        'posts',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('title', sa.String(), nullable=False),
+        sa.Column('text', sa.String(), nullable=False),
+        sa.Column('author_id', sa.Integer(), nullable=True),
+        sa.Column('created', sa.DateTime(), nullable=False),
+        sa.Column('update_date', sa.DateTime(), nullable=False),
+        sa.Column('is_deleted', sa.Boolean(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ['author_id'], ['users.id'],
+            name='posts_author_id_fkey', ondelete='CASCADE'
+        ),
+        sa.PrimaryKeyConstraint('id', name='posts_pkey'),
+    )
+    op.create_index('ix_posts_id', 'posts', ['id'])
+
+    op.create_table(
+        'likes',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('post_id', sa.Integer(), nullable=True),
+        sa.Column('like', sa.Boolean(), nullable=False),
+        sa.Column('update_date', sa.DateTime(), nullable=False),
+        sa.Column('created', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ['user_id'], ['users.id'],
+            name='likes_user_id_fkey', ondelete='CASCADE'
+        ),
+        sa.ForeignKeyConstraint(
+            ['post_id'], ['posts.id'],
+            name='likes_post_id_fkey', ondelete='CASCADE'
+        ),
+        sa.PrimaryKeyConstraint('id', name='likes_pkey'),
+        sa.UniqueConstraint('user_id', 'post_id', name='unique_likes'),
+    )
+    op.create_index('ix_likes_id', 'likes', ['id'])
+
+    op.create_table(
+        'users_activity',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('url', sa.String(), nullable=False),
+        sa.Column('addr', sa.String(), nullable=False),
+        sa.Column('port', sa.Integer(), nullable=False),
+        sa.Column('method', sa.String(), nullable=False),
+        sa.Column('user_agent', sa.String(), nullable=True),
+        sa.Column('content_type', sa.String(), nullable=True),
+        sa.Column('content_length', sa.String(), nullable=True),
+        sa.Column('body', sa.String(), nullable=True),
+        sa.Column('query_string', sa.String(), nullable=True),
+        sa.Column('form_data', sa.String(), nullable=True),
+        sa.Column('user', sa.Integer(), nullable=True),
+        sa.Column('auth', sa.Integer(), nullable=True),
+        sa.Column('result_status', sa.Integer(), nullable=True),
+        sa.Column('result_len', sa.Integer(), nullable=True),
+        sa.Column('result_content', sa.String(), nullable=True),
+        sa.Column('millis', sa.Float(), nullable=True),
+        sa.Column('traceback', sa.String(), nullable=True),
+        sa.Column('created', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ['user'], ['users.id'], name='users_activity_user_fkey'
+        ),
+        sa.ForeignKeyConstraint(
+            ['auth'], ['auth.id'], name='users_activity_auth_fkey'
+        ),
+        sa.PrimaryKeyConstraint('id', name='users_activity_pkey'),
+    )
+    op.create_index('ix_users_activity_id', 'users_activity', ['id'])
+
+
+def downgrade() -> None:
+    op.drop_table('users_activity')
+    op.drop_table('likes')
+    op.drop_table('posts')
+    op.drop_table('auth')
+    op.drop_table('users')
@@ -0,0 +1,31 @@
+"""user token_epoch
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17 12:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'users',
+        sa.Column(
+            'token_epoch', sa.Integer(), server_default='0', nullable=False
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('users', 'token_epoch')
@@ -0,0 +1,72 @@
+"""auth token hash
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17 12:20:00.000000
+
+Tokens are looked up by the sha256 digest instead of the full JWT.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'auth', sa.Column('access_token_hash', sa.LargeBinary(32))
+    )
+    op.add_column(
+        'auth', sa.Column('refresh_token_hash', sa.LargeBinary(32))
+    )
+    # the same digest as app.auth.models.token_digest
+    op.execute(
+        "UPDATE auth SET "
+        "access_token_hash = sha256(convert_to(access_token, 'UTF8')), "
+        "refresh_token_hash = sha256(convert_to(refresh_token, 'UTF8'))"
+    )
+    op.alter_column('auth', 'access_token_hash', nullable=False)
+    op.alter_column('auth', 'refresh_token_hash', nullable=False)
+    op.create_index(
+        'ix_auth_access_token_hash', 'auth', ['access_token_hash'],
+        unique=True,
+    )
+    op.create_index(
+        'ix_auth_refresh_token_hash', 'auth', ['refresh_token_hash'],
+        unique=True,
+    )
+    op.drop_constraint('auth_access_token_key', 'auth', type_='unique')
+    op.drop_constraint('auth_refresh_token_key', 'auth', type_='unique')
+    op.drop_column('auth', 'access_token')
+    op.drop_column('auth', 'refresh_token')
+
+
+def downgrade() -> None:
+    # The tokens can not be restored from the digests,
+    # every authorization has to log in again.
+    op.add_column('auth', sa.Column('access_token', sa.String()))
+    op.add_column('auth', sa.Column('refresh_token', sa.String()))
+    op.execute(
+        "UPDATE auth SET is_active = false, "
+        "access_token = encode(access_token_hash, 'hex'), "
+        "refresh_token = encode(refresh_token_hash, 'hex')"
+    )
+    op.alter_column('auth', 'access_token', nullable=False)
+    op.alter_column('auth', 'refresh_token', nullable=False)
+    op.create_unique_constraint(
+        'auth_access_token_key', 'auth', ['access_token']
+    )
+    op.create_unique_constraint(
+        'auth_refresh_token_key', 'auth', ['refresh_token']
+    )
+    op.drop_index('ix_auth_access_token_hash', 'auth')
+    op.drop_index('ix_auth_refresh_token_hash', 'auth')
+    op.drop_column('auth', 'access_token_hash')
+    op.drop_column('auth', 'refresh_token_hash')
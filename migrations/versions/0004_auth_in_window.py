@@ -0,0 +1,43 @@
+"""auth in_window
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17 12:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.settings import CONCURRENT_CONNECTIONS
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'auth',
+        sa.Column(
+            'in_window', sa.Boolean(), server_default=sa.true(),
+            nullable=False,
+        ),
+    )
+    if CONCURRENT_CONNECTIONS:
+        op.execute(
+            "UPDATE auth SET in_window = newest.rn <= "
+            f"{int(CONCURRENT_CONNECTIONS)} "
+            "FROM (SELECT id, row_number() OVER "
+            "(PARTITION BY user_id ORDER BY id DESC) AS rn "
+            "FROM auth WHERE is_active) AS newest "
+            "WHERE auth.id = newest.id"
+        )
+
+
+def downgrade() -> None:
+    op.drop_column('auth', 'in_window')
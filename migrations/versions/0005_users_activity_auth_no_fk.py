@@ -0,0 +1,36 @@
+"""users_activity auth without foreign key
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-17 12:40:00.000000
+
+Stale auth rows are purged, the activity logs keep the id of their
+authorization, so that the logs of a revoked session can still be found.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.drop_constraint(
+        'users_activity_auth_fkey', 'users_activity', type_='foreignkey'
+    )
+
+
+def downgrade() -> None:
+    op.execute(
+        'UPDATE users_activity SET auth = NULL WHERE auth IS NOT NULL '
+        'AND NOT EXISTS (SELECT 1 FROM auth WHERE auth.id = users_activity.auth)'
+    )
+    op.create_foreign_key(
+        'users_activity_auth_fkey', 'users_activity', 'auth',
+        ['auth'], ['id'],
+    )
@@ -0,0 +1,33 @@
+"""users_activity body_truncated
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17 13:00:00.000000
+
+The logged body is cut to ACTIVITY_LOG_BODY_LIMIT bytes.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'users_activity',
+        sa.Column(
+            'body_truncated', sa.Boolean(), nullable=False,
+            server_default=sa.false(),
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('users_activity', 'body_truncated')
@@ -0,0 +1,36 @@
+"""users_activity timings
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17 13:20:00.000000
+
+Stages of the request time, see app.timing.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0007'
+down_revision: Union[str, None] = '0006'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+COLUMNS = (
+    'auth_millis', 'db_millis', 'handler_millis', 'serialize_millis',
+    'log_millis',
+)
+
+
+def upgrade() -> None:
+    for column in COLUMNS:
+        op.add_column(
+            'users_activity', sa.Column(column, sa.Float(), nullable=True)
+        )
+
+
+def downgrade() -> None:
+    for column in reversed(COLUMNS):
+        op.drop_column('users_activity', column)
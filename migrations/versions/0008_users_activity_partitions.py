@@ -0,0 +1,72 @@
+"""users_activity partitioned by created
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17 13:40:00.000000
+
+The existing table becomes the partition of the current period, with
+everything before its end, so that ActivityPartitionManager expires it
+as any other partition. The id sequence is kept.
+"""
+import datetime
+from typing import Sequence, Union
+
+from alembic import op
+
+from app.auth.tasks import ActivityPartitionManager
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008'
+down_revision: Union[str, None] = '0007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def create_constraints(table: str, primary_key: list[str]) -> None:
+    op.create_primary_key('users_activity_pkey', table, primary_key)
+    op.create_foreign_key(
+        'users_activity_user_fkey', table, 'users', ['user'], ['id'],
+    )
+    op.create_index('ix_users_activity_id', table, ['id'])
+
+
+def upgrade() -> None:
+    start = ActivityPartitionManager.period_start(datetime.date.today())
+    end = start + datetime.timedelta(days=ActivityPartitionManager.days)
+    legacy = ActivityPartitionManager.partition_name(start)
+
+    op.rename_table('users_activity', legacy)
+    op.execute(f'ALTER INDEX users_activity_pkey RENAME TO {legacy}_pkey')
+    op.execute(f'ALTER INDEX ix_users_activity_id RENAME TO ix_{legacy}_id')
+    op.drop_constraint('users_activity_user_fkey', legacy, type_='foreignkey')
+
+    op.execute(
+        f'CREATE TABLE users_activity (LIKE {legacy} INCLUDING DEFAULTS) '
+        f'PARTITION BY RANGE (created)'
+    )
+    op.execute('ALTER SEQUENCE users_activity_id_seq OWNED BY users_activity.id')
+    create_constraints('users_activity', ['id', 'created'])
+    op.execute(
+        f"ALTER TABLE users_activity ATTACH PARTITION {legacy} "
+        f"FOR VALUES FROM (MINVALUE) TO ('{end}')"
+    )
+    op.execute(
+        'CREATE TABLE users_activity_default '
+        'PARTITION OF users_activity DEFAULT'
+    )
+
+
+def downgrade() -> None:
+    op.execute(
+        'CREATE TABLE users_activity_plain '
+        '(LIKE users_activity INCLUDING DEFAULTS)'
+    )
+    op.execute('INSERT INTO users_activity_plain SELECT * FROM users_activity')
+    op.execute(
+        'ALTER SEQUENCE users_activity_id_seq '
+        'OWNED BY users_activity_plain.id'
+    )
+    op.drop_table('users_activity')
+    op.rename_table('users_activity_plain', 'users_activity')
+    create_constraints('users_activity', ['id'])
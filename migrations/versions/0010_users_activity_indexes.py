@@ -0,0 +1,39 @@
+"""users_activity indexes of the admin API
+
+Revision ID: 0010
+Revises: 0009
+Create Date: 2026-10-17 14:10:00.000000
+
+Every filter of GET /admin/activity is followed by (created, id),
+the key of its keyset pagination. The indexes are created on all
+partitions, which locks users_activity against writes meanwhile.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0010'
+down_revision: Union[str, None] = '0009'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = {
+    'ix_users_activity_created_id': ['created', 'id'],
+    'ix_users_activity_user_created_id': ['user', 'created', 'id'],
+    'ix_users_activity_auth_created_id': ['auth', 'created', 'id'],
+    'ix_users_activity_url_created_id': ['url', 'created', 'id'],
+    'ix_users_activity_result_status_created_id':
+        ['result_status', 'created', 'id'],
+}
+
+
+def upgrade() -> None:
+    for name, columns in INDEXES.items():
+        op.create_index(name, 'users_activity', columns)
+
+
+def downgrade() -> None:
+    for name in INDEXES:
+        op.drop_index(name, 'users_activity')
@@ -0,0 +1,48 @@
+"""route_stats rollups
+
+Revision ID: 0011
+Revises: 0010
+Create Date: 2026-10-17 14:30:00.000000
+
+Per-minute request rollups and the route template of the logs.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0011'
+down_revision: Union[str, None] = '0010'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column(
+        'users_activity', sa.Column('route', sa.String(), nullable=True)
+    )
+    op.create_table(
+        'route_stats',
+        sa.Column('minute', sa.DateTime(), nullable=False),
+        sa.Column('route', sa.String(), nullable=False),
+        sa.Column('method', sa.String(), nullable=False),
+        sa.Column('status', sa.Integer(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.Column('total_millis', sa.Float(), nullable=False),
+        sa.Column('min_millis', sa.Float(), nullable=False),
+        sa.Column('max_millis', sa.Float(), nullable=False),
+        sa.Column(
+            'sketch', postgresql.ARRAY(sa.Integer()), nullable=False
+        ),
+        sa.PrimaryKeyConstraint(
+            'minute', 'route', 'method', 'status', name='route_stats_pkey'
+        ),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('route_stats')
+    op.drop_column('users_activity', 'route')
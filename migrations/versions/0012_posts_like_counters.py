@@ -0,0 +1,40 @@
+"""posts like counters
+
+Revision ID: 0012
+Revises: 0011
+Create Date: 2026-10-17 14:50:00.000000
+
+Stored counts of likes and dislikes instead of subqueries.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0012'
+down_revision: Union[str, None] = '0011'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    for column in ('likes_count', 'dislikes_count'):
+        op.add_column(
+            'posts',
+            sa.Column(column, sa.Integer(), nullable=False, server_default='0'),
+        )
+    op.execute(
+        'UPDATE posts SET likes_count = c.likes, dislikes_count = c.dislikes '
+        'FROM (SELECT post_id, '
+        'count(*) FILTER (WHERE "like") AS likes, '
+        'count(*) FILTER (WHERE NOT "like") AS dislikes '
+        'FROM likes GROUP BY post_id) AS c '
+        'WHERE posts.id = c.post_id'
+    )
+
+
+def downgrade() -> None:
+    op.drop_column('posts', 'dislikes_count')
+    op.drop_column('posts', 'likes_count')
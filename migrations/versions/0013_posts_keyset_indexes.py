@@ -0,0 +1,38 @@
+"""posts indexes of the keyset pagination
+
+Revision ID: 0013
+Revises: 0012
+Create Date: 2026-10-17 15:00:00.000000
+
+GET /posts/ with a cursor reads the not deleted posts by (created, id),
+optionally of one author.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0013'
+down_revision: Union[str, None] = '0012'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = {
+    'ix_posts_created_id': ['created', 'id'],
+    'ix_posts_author_created_id': ['author_id', 'created', 'id'],
+}
+
+
+def upgrade() -> None:
+    for name, columns in INDEXES.items():
+        op.create_index(
+            name, 'posts', columns,
+            postgresql_where=sa.text('is_deleted = false'),
+        )
+
+
+def downgrade() -> None:
+    for name in INDEXES:
+        op.drop_index(name, 'posts')
@@ -9,9 +9,12 @@ from httpx import AsyncClient
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, \
     async_sessionmaker
 
-from app.auth.auth import BasicAuthBackend
-from app.auth.router_class import BaseUserLogs
-from app.database import get_session, Base
+from app.auth.log_writer import ActivityLogWriter, activity_log_writer
+from app.auth.spool import SpoolLoader
+from app.auth.tasks import AuthTokenCleaner, ActivityPartitionManager
+from app.database import RequestSession, Base
+from app.posts.reconcile import LikesReconciler
+from app.timing import instrument_engine
 from app.settings import (DB_HOST_TEST, DB_NAME_TEST, DB_PASS_TEST,
                           DB_PORT_TEST,
                           DB_USER_TEST)
@@ -23,19 +26,19 @@ DATABASE_URL_TEST = f"postgresql+asyncpg://{DB_USER_TEST}:{DB_PASS_TEST}@{DB_HOS
 
 
 engine_test = create_async_engine(DATABASE_URL_TEST, echo=False)
+instrument_engine(engine_test)
 async_session = async_sessionmaker(
     engine_test, class_=AsyncSession, expire_on_commit=False
 )
 Base.metadata.bind = engine_test
 
 
-async def override_get_async_session() -> AsyncGenerator[AsyncSession, None]:
-    async with async_session() as session:
-        yield session
-
-app.dependency_overrides[get_session] = override_get_async_session
-BaseUserLogs.a_s = async_session
-BasicAuthBackend.a_s = async_session
+RequestSession.a_s = async_session
+ActivityLogWriter.a_s = async_session
+AuthTokenCleaner.a_s = async_session
+ActivityPartitionManager.a_s = async_session
+SpoolLoader.a_s = async_session
+LikesReconciler.a_s = async_session
 
 
 @pytest.fixture(autouse=True, scope='session')
@@ -61,8 +64,11 @@ client = TestClient(app=app, base_url="http://test")
 
 @pytest.fixture(scope="session")
 async def ac() -> AsyncGenerator[AsyncClient, None]:
+    log_writer = asyncio.create_task(activity_log_writer.run())
     async with AsyncClient(app=app, base_url="http://test") as ac:
         yield ac
+    activity_log_writer.stop()
+    await log_writer
 
 
 @pytest.fixture(scope="session")
@@ -0,0 +1,91 @@
+import datetime
+from typing import List
+
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import insert, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.auth.cache import forget_user
+from app.auth.log_writer import activity_log_writer
+from app.auth.models import UsersActivity
+from app.users.models import User
+from tests.test_auth import HTTP_ERROR_401
+from tests.test_data import FakeUser
+
+
+@pytest.mark.order(6)
+async def test_admin_activity(
+        ac: AsyncClient, db: AsyncSession, users: List[FakeUser]
+):
+    admin, user = users[0], users[1]
+    response = await ac.get("/admin/activity")
+    assert response.status_code == 401
+    assert response.json() == HTTP_ERROR_401
+
+    headers = {"Authorization": f"{user.token_type} {user.access_token}"}
+    response = await ac.get("/admin/activity", headers=headers)
+    assert response.status_code == 403
+
+    await db.execute(
+        update(User).where(User.id == admin.id).values(is_superuser=True)
+    )
+    created = datetime.datetime.now()
+    await db.execute(insert(UsersActivity), [
+        {
+            "url": "/admin-test", "addr": "127.0.0.1", "port": 1,
+            "method": "GET", "user": admin.id, "result_status": 200,
+            # two records share created, id breaks the tie
+            "created": created - datetime.timedelta(seconds=i // 2),
+        } for i in range(5)
+    ])
+    await db.commit()
+    forget_user(admin.id)
+
+    headers = {"Authorization": f"{admin.token_type} {admin.access_token}"}
+    params = {"url": "/admin-test", "user": admin.id, "limit": 2}
+    pages = []
+    while True:
+        response = await ac.get(
+            "/admin/activity", headers=headers, params=params
+        )
+        assert response.status_code == 200
+        page = response.json()
+        pages.append(page["items"])
+        if not page["next_cursor"]:
+            break
+        params["cursor"] = page["next_cursor"]
+
+    items = [item for page in pages for item in page]
+    assert len(items) == 5
+    keys = [(item["created"], item["id"]) for item in items]
+    assert keys == sorted(keys, reverse=True)
+
+    params["cursor"] = "broken"
+    response = await ac.get("/admin/activity", headers=headers, params=params)
+    assert response.status_code == 400
+
+
+@pytest.mark.order(6)
+async def test_route_stats(ac: AsyncClient, users: List[FakeUser]):
+    admin = users[0]
+    headers = {"Authorization": f"{admin.token_type} {admin.access_token}"}
+    date_from = datetime.datetime.now().replace(second=0, microsecond=0)
+    for _ in range(3):
+        response = await ac.get("/user/", headers=headers)
+        assert response.status_code == 200
+    await activity_log_writer.write_stats()
+
+    response = await ac.get(
+        "/admin/route-stats", headers=headers, params={
+            "route": "/user/",
+            "method": "get",
+            "date_from": date_from.isoformat(),
+            "step": 60,
+        }
+    )
+    assert response.status_code == 200
+    points = response.json()
+    assert sum(point["count"] for point in points) >= 3
+    for point in points:
+        assert point["min_millis"] <= point["p50"] <= point["max_millis"]
@@ -1,11 +1,33 @@
+import asyncio
+import datetime
+import json
+import os
+import subprocess
+import threading
 import time
-from typing import List
+from typing import List, Optional
 
 import pytest
+from fastapi import HTTPException
 from httpx import AsyncClient
+from sqlalchemy import event, select, func, text, insert, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.requests import Request
 
-from app.auth.schemas import Token, create_token
+from app.auth import models
+from app.auth.auth import BasicAuthBackend
+from app.auth.cache import token_cache
+from app.auth.hashing import PasswordHasher, make_context, pwd_context
+from app.auth.log_writer import activity_log_writer, ActivityLogWriter
+from app.auth.spool import ActivitySpool, SpoolLoader
+from app.auth.activity import BodyCapture, ActivityLogMiddleware
+from app.auth.router_class import RouteWithOutAuth
+from app.auth.schemas import Token, create_token, get_new_token
+from app.auth.tasks import AuthTokenCleaner, ActivityPartitionManager
+from app.database import RequestSession
+from app.settings import BCRYPT_ROUNDS
 from app.users.schemas import UserToken
+from tests.conftest import engine_test, async_session
 from tests.test_data import FakeUser
 
 
@@ -262,3 +284,484 @@ async def test_change_password(ac: AsyncClient, users: List[FakeUser]):
             assert response.status_code == 200, f"{user}"
             assert response.json() == response_result[200]["result"], f"{user}"
             user.password = new_password
+
+
+@pytest.mark.order(5)
+async def test_token_cache(ac: AsyncClient, users: List[FakeUser]):
+    user = users[0]
+    response = await ac.post(
+        "/auth/login", data={
+            "username": user.email,
+            "password": user.password,
+        }
+    )
+    assert response.status_code == 201
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+    hits = token_cache.hits
+    for _ in range(2):
+        response = await ac.get("/user/", headers=headers)
+        assert response.status_code == 200
+    assert token_cache.hits > hits
+
+    response = await ac.delete("/auth/logout", headers=headers)
+    assert response.status_code == 204
+
+    response = await ac.get("/user/", headers=headers)
+    assert response.status_code == 401
+    assert response.json() == HTTP_ERROR_401
+
+
+@pytest.mark.order(5)
+async def test_authentication_single_statement(users: List[FakeUser]):
+    user = users[0]
+    request = Request({
+        "type": "http",
+        "headers": [(
+            b"authorization",
+            f"{user.token_type} {user.access_token}".encode(),
+        )],
+    })
+    statements = []
+
+    def count_statements(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    token_cache.clear()
+    event.listen(
+        engine_test.sync_engine, "before_cursor_execute", count_statements
+    )
+    try:
+        auth, db_user = await BasicAuthBackend().authenticate(request)
+    finally:
+        event.remove(
+            engine_test.sync_engine, "before_cursor_execute", count_statements
+        )
+        await RequestSession.close(request)
+
+    assert db_user.id == user.id
+    assert auth.user_id == user.id
+    assert len(statements) == 1
+
+
+@pytest.mark.order(5)
+async def test_concurrent_refresh(
+        ac: AsyncClient, users: List[FakeUser], db: AsyncSession
+):
+    user = users[4]
+    response = await ac.post("/auth/login", data={
+        "username": user.email, "password": user.password,
+    })
+    refresh_token = response.json()["refresh_token"]
+
+    # the refresh_token is checked and rotated by one statement
+    statements = []
+
+    def count_statements(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(
+        engine_test.sync_engine, "before_cursor_execute", count_statements
+    )
+    try:
+        async with async_session() as session:
+            await get_new_token(refresh_token, session)
+    finally:
+        event.remove(
+            engine_test.sync_engine, "before_cursor_execute", count_statements
+        )
+    assert len(statements) == 1
+
+    # both requests wait for the row lock, only the first one wins
+    await db.execute(
+        select(models.AuthToken).where(
+            models.AuthToken.refresh_token_hash ==
+            models.token_digest(refresh_token)
+        ).with_for_update()
+    )
+    requests = [
+        asyncio.create_task(ac.post(
+            "/auth/token", json={"refresh_token": refresh_token}
+        )) for _ in range(2)
+    ]
+    await asyncio.sleep(0.5)
+    await db.rollback()
+    responses = await asyncio.gather(*requests)
+    assert sorted(r.status_code for r in responses) == [201, 409]
+
+    winner = next(r for r in responses if r.status_code == 201)
+    response = await ac.get("/user/", headers={
+        "Authorization": f"Bearer {winner.json()['access_token']}"
+    })
+    assert response.status_code == 200
+    # the refresh_token stays valid for the next refresh
+    response = await ac.post(
+        "/auth/token", json={"refresh_token": refresh_token}
+    )
+    assert response.status_code == 201
+
+
+@pytest.mark.order(5)
+async def test_stateless_access_token(
+        ac: AsyncClient, users: List[FakeUser], monkeypatch
+):
+    monkeypatch.setattr("app.auth.auth.STATELESS_ACCESS_TOKENS", True)
+    monkeypatch.setattr("app.auth.router.STATELESS_ACCESS_TOKENS", True)
+    user = users[1]
+    tokens = []
+    for _ in range(2):
+        response = await ac.post(
+            "/auth/login", data={
+                "username": user.email,
+                "password": user.password,
+            }
+        )
+        assert response.status_code == 201
+        tokens.append(response.json())
+    headers = [
+        {"Authorization": f"Bearer {token['access_token']}"}
+        for token in tokens
+    ]
+
+    for h in headers:
+        response = await ac.get("/user/", headers=h)
+        assert response.status_code == 200
+
+    # a new epoch revokes every access token of the user
+    response = await ac.delete("/auth/logout", headers=headers[0])
+    assert response.status_code == 204
+    for h in headers:
+        response = await ac.get("/user/", headers=h)
+        assert response.status_code == 401
+
+    # the other authorization is still alive
+    response = await ac.post(
+        "/auth/token", json={"refresh_token": tokens[0]["refresh_token"]}
+    )
+    assert response.status_code == 401
+    response = await ac.post(
+        "/auth/token", json={"refresh_token": tokens[1]["refresh_token"]}
+    )
+    assert response.status_code == 201
+    response = await ac.get(
+        "/user/",
+        headers={"Authorization": f"Bearer {response.json()['access_token']}"}
+    )
+    assert response.status_code == 200
+
+
+@pytest.mark.order(5)
+async def test_purge_auth_tokens(db: AsyncSession):
+    inactive = select(func.count(models.AuthToken.id)).where(
+        models.AuthToken.is_active == False
+    )
+    active = select(func.count(models.AuthToken.id)).where(
+        models.AuthToken.is_active == True
+    )
+    assert await db.scalar(inactive) > 0
+    active_before = await db.scalar(active)
+
+    cleaner = AuthTokenCleaner()
+    cleaner.batch_size = 2
+    cleaner.batch_pause = 0
+    assert await cleaner.purge() > 0
+
+    assert await db.scalar(inactive) == 0
+    assert await db.scalar(active) == active_before
+
+
+@pytest.mark.order(5)
+async def test_concurrent_logins_window(
+        ac: AsyncClient, users: List[FakeUser], db: AsyncSession, monkeypatch
+):
+    monkeypatch.setattr("app.auth.schemas.CONCURRENT_CONNECTIONS", 1)
+    user = users[2]
+    responses = await asyncio.gather(*(
+        ac.post("/auth/login", data={
+            "username": user.email, "password": user.password,
+        }) for _ in range(5)
+    ))
+    assert all(response.status_code == 201 for response in responses)
+    in_window = await db.scalar(
+        select(func.count(models.AuthToken.id)).where(
+            models.AuthToken.user_id == user.id,
+            models.AuthToken.is_active == True,
+            models.AuthToken.in_window == True,
+        )
+    )
+    assert in_window == 1
+
+
+@pytest.mark.order(5)
+async def test_activity_partitions(db: AsyncSession):
+    manager = ActivityPartitionManager()
+    # logged while the partition of today is missing
+    await db.execute(insert(models.UsersActivity).values(
+        url="/partition-test", addr="127.0.0.1", port=1, method="GET",
+    ))
+    await db.commit()
+    assert await db.scalar(text(
+        "SELECT count(*) FROM users_activity_default"
+    ))
+    total = await db.scalar(text("SELECT count(*) FROM users_activity"))
+    await db.commit()
+    await manager.create_partitions()
+    assert await db.scalar(text(
+        "SELECT count(*) FROM users_activity_default"
+    )) == 0
+    assert await db.scalar(text(
+        "SELECT count(*) FROM users_activity"
+    )) == total
+    # created already: nothing to do
+    assert await manager.create_partition(
+        manager.period_start(datetime.date.today())
+    ) is False
+    today = manager.period_start(datetime.date.today())
+    names = [name for name, _ in await manager.partitions(db)]
+    assert manager.partition_name(today) in names
+    assert len(names) == manager.premake + 1
+
+    await db.execute(text(
+        "CREATE TABLE users_activity_20000101 PARTITION OF users_activity "
+        "FOR VALUES FROM ('2000-01-01') TO ('2000-01-02')"
+    ))
+    await db.commit()
+    assert await manager.expire_partitions() == ["users_activity_20000101"]
+    names = [name for name, _ in await manager.partitions(db)]
+    assert "users_activity_20000101" not in names
+    assert manager.partition_name(today) in names
+
+
+@pytest.mark.order(5)
+async def test_login_rehashes_outdated_password(
+        ac: AsyncClient, users: List[FakeUser], db: AsyncSession
+):
+    user = users[3]
+    outdated = make_context(["bcrypt"], bcrypt_rounds=4).hash(user.password)
+    await db.execute(
+        update(models.User).where(
+            models.User.id == user.id
+        ).values(hashed_password=outdated)
+    )
+    await db.commit()
+
+    response = await ac.post("/auth/login", data={
+        "username": user.email, "password": user.password,
+    })
+    assert response.status_code == 201
+    stored = await db.scalar(
+        select(models.User.hashed_password).where(
+            models.User.id == user.id
+        )
+    )
+    await db.commit()
+    assert stored != outdated
+    assert stored.startswith(f"$2b${BCRYPT_ROUNDS}$")
+    assert pwd_context.verify(user.password, stored)
+
+
+@pytest.mark.order(5)
+async def test_password_hasher_overload():
+    hasher = PasswordHasher("thread", workers=2, queue=1)
+    release = threading.Event()
+    busy = [
+        asyncio.create_task(hasher.run(release.wait))
+        for _ in range(hasher.limit)
+    ]
+    await asyncio.sleep(0)
+    assert hasher.pending == 3
+
+    with pytest.raises(HTTPException) as error:
+        await hasher.run(release.wait)
+    assert error.value.status_code == 503
+    assert error.value.headers["Retry-After"] == "1"
+
+    release.set()
+    await asyncio.gather(*busy)
+    assert hasher.pending == 0
+    hasher.shutdown()
+
+
+@pytest.mark.order(5)
+async def test_body_capture():
+    chunks = [b"a" * 3000, b"b" * 3000, b"c" * 3000]
+
+    async def receive():
+        body = chunks.pop(0)
+        return {
+            "type": "http.request", "body": body, "more_body": bool(chunks)
+        }
+
+    capture = BodyCapture(receive, limit=4096)
+    request = Request({"type": "http", "headers": []}, receive=capture)
+    # the handler still gets the whole body
+    assert await request.body() == b"a" * 3000 + b"b" * 3000 + b"c" * 3000
+    assert await capture.read() == b"a" * 3000 + b"b" * 1096
+    assert capture.truncated and capture.complete
+
+
+async def log_request(route, result_status: int) -> Optional[dict]:
+    """
+    Passes a POST with a JSON body that the app does not read through
+    ActivityLogMiddleware, returns the logged record.
+    """
+    writer = ActivityLogWriter(queue_size=10, batch_size=10, flush_interval=1)
+    responded = False
+
+    async def app(scope, receive, send):
+        nonlocal responded
+        scope["route"] = route
+        await send({
+            "type": "http.response.start", "status": result_status,
+            "headers": [],
+        })
+        await send({"type": "http.response.body", "body": b"{}"})
+        responded = True
+
+    async def receive():
+        # as uvicorn: after the response only the disconnect is left
+        if responded:
+            return {"type": "http.disconnect"}
+        return {"type": "http.request", "body": b'{"title": "t"}'}
+
+    async def send(message):
+        pass
+
+    scope = {
+        "type": "http", "method": "POST", "path": route.path,
+        "headers": [(b"content-type", b"application/json")],
+        "query_string": b"", "client": ("127.0.0.1", 1),
+    }
+    await ActivityLogMiddleware(app, log_writer=writer)(scope, receive, send)
+    return None if writer.queue.empty() else writer.queue.get_nowait()
+
+
+@pytest.mark.order(5)
+async def test_unread_body_logged():
+    # rejected before the body is parsed
+    route = RouteWithOutAuth("/unread", endpoint=lambda: None)
+    record = await log_request(route, 401)
+    assert record["result_status"] == 401
+    assert record["body"] == '{"title": "t"}'
+
+
+@pytest.mark.order(5)
+async def test_logging_policy():
+    class Sampled(RouteWithOutAuth):
+        log_sample_rate = 0.0
+        log_slow_millis = 100
+
+    route = Sampled("/sampled", endpoint=lambda: None)
+    for result_status, millis, logged in (
+            (200, 10, False),
+            (200, 150, True),
+            (399, 10, False),
+            (400, 10, True),
+            (500, 10, True),
+            # the response was never started
+            (None, 10, True),
+    ):
+        u_act = {"result_status": result_status, "millis": millis}
+        assert ActivityLogMiddleware.should_log(u_act, route) is logged, \
+            (result_status, millis)
+
+    class Quiet(RouteWithOutAuth):
+        log_sample_rate = 0.0
+
+    assert await log_request(Quiet("/quiet", endpoint=lambda: None), 200) \
+        is None
+
+    class NoBody(RouteWithOutAuth):
+        log_body = False
+
+    record = await log_request(NoBody("/no-body", endpoint=lambda: None), 200)
+    assert record["body"] is None
+
+
+@pytest.mark.order(5)
+async def test_server_timing(
+        ac: AsyncClient, users: List[FakeUser], monkeypatch
+):
+    monkeypatch.setattr("app.auth.activity.SERVER_TIMING", True)
+    user = users[0]
+    response = await ac.post(
+        "/auth/login", data={
+            "username": user.email,
+            "password": user.password,
+        }
+    )
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    response = await ac.get("/user/", headers=headers)
+    assert response.status_code == 200
+    stages = {
+        stage.split(";")[0]
+        for stage in response.headers["Server-Timing"].split(", ")
+    }
+    assert {"log", "auth", "route", "handler", "total"} <= stages
+
+
+@pytest.mark.order(5)
+async def test_activity_log_bad_records(db: AsyncSession):
+    writer = ActivityLogWriter(queue_size=10, batch_size=10, flush_interval=1)
+    records = [
+        writer.new_record(
+            created=datetime.datetime.now(), url="/bad-records",
+            method="GET", addr="127.0.0.1", port=1, body_truncated=False,
+            **values,
+        ) for values in (
+            {},
+            # purged by AuthTokenCleaner before the flush, the id stays
+            {"auth": 10 ** 9},
+            # rejected by the foreign key
+            {"user": 10 ** 9},
+        )
+    ]
+    assert await writer.write(records) == 2
+    auth = await db.scalars(
+        select(models.UsersActivity.auth).where(
+            models.UsersActivity.url == "/bad-records"
+        )
+    )
+    assert sorted(auth.all(), key=str) == [10 ** 9, None]
+
+
+@pytest.mark.order(5)
+async def test_activity_spool(db: AsyncSession, tmp_path):
+    spool = ActivitySpool(tmp_path, segment_size=1024, segment_seconds=60)
+    records = [
+        activity_log_writer.new_record(
+            created=datetime.datetime.now(), url="/spool", method="GET",
+            addr="127.0.0.1", port=1, body_truncated=False,
+        ) for _ in range(20)
+    ]
+    spool.append(records[:10])
+    spool.append(records[10:])
+    spool.rotate()
+    assert not list(tmp_path.glob("*.open"))
+
+    count = select(func.count(models.UsersActivity.id)).where(
+        models.UsersActivity.url == "/spool"
+    )
+    assert await SpoolLoader(tmp_path).load() == 20
+    assert await db.scalar(count) == 20
+    assert not list(tmp_path.iterdir())
+
+    # left by a worker that died while writing its segment
+    dead = subprocess.Popen(["true"])
+    dead.wait()
+    lines = [json.dumps(r, default=str) for r in records[:5]]
+    (tmp_path / f"activity-1-{dead.pid}.jsonl.open").write_text(
+        "\n".join(lines) + '\n{"cut'
+    )
+    # claimed by a loader that died before the COPY
+    loading = tmp_path / "activity-2-1.jsonl.loading"
+    loading.write_text("\n".join(lines) + "\n")
+    os.utime(loading, (0, 0))
+    # a segment of a live writer stays
+    (tmp_path / f"activity-3-{os.getpid()}.jsonl.open").write_text("")
+
+    assert await SpoolLoader(tmp_path).load() == 10
+    assert await db.scalar(count) == 30
+    assert [p.name for p in tmp_path.iterdir()] == [
+        f"activity-3-{os.getpid()}.jsonl.open"
+    ]
@@ -0,0 +1,38 @@
+from typing import List
+
+import pytest
+from httpx import AsyncClient
+
+from app.metrics.registry import MetricsRegistry
+from tests.test_data import FakeUser
+
+
+@pytest.mark.order(6)
+async def test_metrics(ac: AsyncClient, users: List[FakeUser]):
+    user = users[0]
+    headers = {"Authorization": f"{user.token_type} {user.access_token}"}
+    response = await ac.get("/user/", headers=headers)
+    assert response.status_code == 200
+
+    response = await ac.get("/metrics")
+    assert response.status_code == 200
+    text = response.text
+    assert 'http_requests_total{method="GET",route="/user/",status="200"}' \
+        in text
+    assert 'http_request_duration_seconds_bucket{method="GET",' \
+           'route="/user/",status="200",le="+Inf"}' in text
+    assert "db_pool_checked_out" in text
+    assert 'auth_cache_hits_total{cache="token"}' in text
+
+
+def test_metrics_workers():
+    workers = [MetricsRegistry(buckets=(0.1, 1.0)) for _ in range(2)]
+    for registry, seconds in zip(workers, (0.05, 0.5)):
+        registry.inc("requests_total", {"route": "/"})
+        registry.observe("latency_seconds", {"route": "/"}, seconds)
+
+    text = workers[0].render([registry.dump() for registry in workers])
+    assert 'requests_total{route="/"} 2' in text
+    assert 'latency_seconds_bucket{route="/",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{route="/",le="1.0"} 2' in text
+    assert 'latency_seconds_count{route="/"} 2' in text
@@ -1,13 +1,17 @@
 import datetime
 import random
+from types import SimpleNamespace
 from typing import List
 
 import pytest
 from httpx import AsyncClient, Response
-from sqlalchemy import select
+from sqlalchemy import select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.posts.models import Posts
+from app.posts.reconcile import LikesReconciler
+from app.posts.schemas import FilterPosts
+from app.users.models import User
 from tests.test_auth import HTTP_ERROR_401
 from tests.test_data import FakeUser, FakePost
 
@@ -540,6 +544,7 @@ async def test_get_posts(
         assert results.status_code == status_code
         other_parameters = results.json()
         del other_parameters["posts"]
+        del other_parameters["next_cursor"]
 
         if date_to:
             other_parameters["date_to"] = datetime.datetime.strptime(
@@ -558,7 +563,11 @@ async def test_get_posts(
             "date_from": date_from,
             "date_to": date_to,
             "my_like": my_like,
+            "cursor": None,
+            "include_total": True,
+            "estimate_total": False,
             "total": total,
+            "total_estimated": False,
         }
         assert len(results.json()["posts"]) <= results.json()["limit"]
 
@@ -706,3 +715,129 @@ async def test_get_posts(
             author=check_author
         )
 
+
+
+@pytest.mark.order(14)
+async def test_get_posts_cursor(
+        ac: AsyncClient,
+        users: List[FakeUser],
+):
+    user = users[0]
+    headers = {"Authorization": f"{user.token_type} {user.access_token}"}
+    for params in (
+            {"from_new_to_old": True},
+            {"from_new_to_old": False},
+            {"my_like": "all"},
+            {"author": users[1].id},
+    ):
+        expected = []
+        for skip in range(0, 100, 50):
+            by_offset = await ac.get("/posts/", headers=headers, params={
+                **params, "skip": skip, "limit": 50,
+            })
+            expected += [p["id"] for p in by_offset.json()["posts"]]
+
+        ids, cursor = [], None
+        while True:
+            response = await ac.get(
+                "/posts/", headers=headers,
+                params={**params, **({"cursor": cursor} if cursor else {})},
+            )
+            assert response.status_code == 200
+            ids += [p["id"] for p in response.json()["posts"]]
+            cursor = response.json()["next_cursor"]
+            if cursor is None:
+                break
+        assert ids == expected, params
+
+    # a cursor of the opposite sort order
+    response = await ac.get("/posts/", params={"from_new_to_old": True})
+    response = await ac.get("/posts/", params={
+        "from_new_to_old": False, "cursor": response.json()["next_cursor"]
+    })
+    assert response.status_code == 400
+    response = await ac.get("/posts/", params={"cursor": "not a cursor"})
+    assert response.status_code == 400
+
+
+@pytest.mark.order(14)
+async def test_get_posts_total(
+        ac: AsyncClient,
+        users: List[FakeUser],
+):
+    user = users[0]
+    headers = {"Authorization": f"{user.token_type} {user.access_token}"}
+    total = (await ac.get("/posts/")).json()["total"]
+
+    response = await ac.get("/posts/", params={"include_total": False})
+    assert response.status_code == 200
+    assert response.json()["total"] is None
+    assert len(response.json()["posts"]) == 10
+
+    response = await ac.get("/posts/", params={"estimate_total": True})
+    assert response.json()["total_estimated"] is True
+    assert isinstance(response.json()["total"], int)
+    response = await ac.get(
+        "/posts/", params={"estimate_total": True, "author": user.id}
+    )
+    assert response.json()["total_estimated"] is False
+
+    # the cached totals are dropped by a new post
+    response = await ac.post(
+        "/posts/create", headers=headers, json={"title": "t", "text": "t"}
+    )
+    assert response.status_code == 201
+    post_id = response.json()["id"]
+    # past the last page the total is still counted
+    response = await ac.get("/posts/", params={"skip": 1000})
+    assert response.json()["posts"] == []
+    assert response.json()["total"] == total + 1
+    assert (await ac.get("/posts/")).json()["total"] == total + 1
+    await ac.delete(f"/posts/{post_id}", headers=headers)
+    assert (await ac.get("/posts/")).json()["total"] == total
+
+
+@pytest.mark.order(14)
+async def test_window_total(
+        db: AsyncSession,
+        users: List[FakeUser],
+):
+    user = await db.get(User, users[0].id)
+    shapes = [
+        {}, {"from_new_to_old": False}, {"author": users[1].id},
+        {"date_from": datetime.datetime(2020, 2, 1)},
+        {"date_to": datetime.datetime(2020, 2, 1)},
+        {"my_like": True}, {"my_like": False}, {"my_like": "all"},
+        {"my_like": "all", "author": users[1].id},
+    ]
+    for request in (SimpleNamespace(user=None), SimpleNamespace(user=user)):
+        for shape in shapes:
+            q = FilterPosts(**shape)
+            total = await db.scalar(q.select_posts(request, count=True))
+            posts = (await db.execute(
+                q.select_posts(request, with_total=True)
+            )).all()
+            assert len(posts) == min(total, q.limit), shape
+            if posts:
+                assert posts[0].total == total, shape
+
+
+@pytest.mark.order(14)
+async def test_reconcile_like_counters(
+        db: AsyncSession,
+        posts: List[FakePost],
+):
+    post = next(p for p in posts if p.like or p.dislike)
+    await db.execute(
+        update(Posts).where(Posts.id == post.id).values(like=0, dislike=0)
+    )
+    await db.commit()
+
+    assert await LikesReconciler().reconcile() == 1
+    assert await LikesReconciler().reconcile() == 0
+    db_post = await db.scalar(
+        select(Posts).where(Posts.id == post.id).execution_options(
+            populate_existing=True
+        )
+    )
+    assert (db_post.like, db_post.dislike) == (post.like, post.dislike)
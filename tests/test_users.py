@@ -1,8 +1,12 @@
+import asyncio
 from typing import List
 
 import pytest
 from httpx import AsyncClient
+from sqlalchemy import event
 
+from app.auth.cache import token_cache
+from tests.conftest import engine_test
 from tests.test_auth import HTTP_ERROR_401
 from tests.test_data import FakeUser
 
@@ -80,6 +84,35 @@ async def test_change_name_user(ac: AsyncClient, users: List[FakeUser]):
         assert response.json() == response_result[401]["result"]
 
 
+@pytest.mark.order(8)
+async def test_one_connection_per_request(
+        ac: AsyncClient, users: List[FakeUser]
+):
+    user = users[0]
+    headers = {"Authorization": f"{user.token_type} {user.access_token}"}
+    task = asyncio.current_task()
+    checkouts = []
+
+    def count_checkouts(*args):
+        # the activity log writer works in its own task
+        if asyncio.current_task() is task:
+            checkouts.append(args)
+
+    token_cache.clear()
+    event.listen(engine_test.sync_engine.pool, "checkout", count_checkouts)
+    try:
+        response = await ac.put(
+            "/user/", headers=headers, json={"username": user.username}
+        )
+    finally:
+        event.remove(
+            engine_test.sync_engine.pool, "checkout", count_checkouts
+        )
+    assert response.status_code == 200
+    # authentication and the handler share the session
+    assert len(checkouts) == 1
+
+
 @pytest.mark.order(10)
 async def test_delete_me(ac: AsyncClient, users: List[FakeUser]):
     after_del_me = {"id", "username", "email", "is_active"}